@@ -0,0 +1,708 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for ingreedypy.
+
+Runs the ``ingreedytest.test_cases`` lines and a deterministic synthetic
+corpus through ``Ingreedy.parse()`` and the batch modes, and reports
+throughput, per-line latency percentiles and peak memory. Results can be
+saved as JSON and compared against an earlier run::
+
+    $ python ingreedybench.py --output before.json
+    $ python ingreedybench.py --output after.json --compare before.json
+    $ python ingreedybench.py --lines 200000 --workers 1 2 4 8
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from parsimonious.grammar import Grammar
+from parsimonious.nodes import Node
+
+from ingreedypy import (
+    DedupStats, Ingreedy, ParseBudgetExceeded, ParseSession,
+    convert_quantities, register_unit, selective_memo_rules, unit_names)
+
+amounts = ['1', '2', '3', '12', '1/2', '1 1/2', '2 1/4', '0.5', '1.5', '¼',
+           'a', 'two', 'three']
+units = ['cup', 'cups', 'tbsp', 'tsp', 'teaspoon', 'tablespoons', 'g', 'kg',
+         'ml', 'oz', 'lb', 'pound', 'pinch', 'handful', '']
+ingredients = ['flour', 'sugar', 'salt', 'eggs', 'butter', 'milk',
+               'olive oil', 'garlic cloves, minced', 'onion, finely chopped',
+               'of chopped fresh parsley', 'potatoes', 'brown sugar']
+extras = ['salt and pepper to taste', '4lb (900g) chicken thighs',
+          '2 (five ounce) cans tuna', '6 (1/2 inch thick) slices bread']
+
+unit_heavy = ['2 tablespoons flour', '1 teaspoon salt', '3 kilograms potatoes',
+              '4 milliliters milk', '2 punnets raspberries',
+              '750mls/1 pint 7fl oz hot vegetable stock',
+              '2lb 4oz (1kg) potatoes']
+unit_less = ['12345 potatoes', '3 eggs', '2 onions', '4 zucchini',
+             '1 garlic clove, sliced', '6 (thinly sliced) bananas']
+number_heavy = ['one cup flour', 'two five ounce cans tomatoes',
+                'three 28 ounce cans tomatoes', 'ninety grams sugar',
+                'seventy-five ml milk', 'a cup of flour', 'two dozen eggs',
+                'one hundred and twenty grams butter']
+# Lines long enough that one grammar parse takes milliseconds.
+long_lines = [
+    '2 cups ' + ' '.join(['finely chopped fresh flat leaf parsley'] * 20),
+    '1 (14 ounce) can ' + ' and '.join(['diced tomatoes with juice'] * 25),
+]
+
+# Inputs that make the packrat memo grow: a pasted paragraph, and a line of
+# quantities the grammar keeps re-trying.
+pathological = {
+    'paragraph': '2 cups ' + ' '.join(
+        ['finely chopped fresh flat leaf parsley and some more'] * 250),
+    'repeated': '1 ' * 1500 + 'flour',
+}
+
+# Parse budgets to compare on ever longer runs of quantities and breaks.
+budgets = [
+    ('none', {}),
+    ('timeout=0.05', {'timeout': 0.05}),
+    ('max_steps=100000', {'max_steps': 100000}),
+]
+
+memo_policies = [
+    ('all', {}),
+    ('selective', {'memo_rules': selective_memo_rules}),
+    ('limit=2000', {'memo_limit': 2000}),
+    ('direct', {'direct': True}),
+    ('direct+selective', {'direct': True,
+                          'memo_rules': selective_memo_rules}),
+]
+
+
+def synthetic_corpus(size, seed=0):
+    """Return ``size`` recipe-like ingredient lines, deterministically."""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(size):
+        if rng.random() < 0.05:
+            lines.append(rng.choice(extras))
+            continue
+        unit = rng.choice(units)
+        parts = [rng.choice(amounts), unit, rng.choice(ingredients)]
+        lines.append(' '.join(part for part in parts if part))
+    return lines
+
+
+# Typography found in lines pasted from web pages and word processors, and
+# how to introduce it into an ASCII line.
+typography = [
+    ('nbsp', lambda line: line.replace(' ', '\u00a0', 1)),
+    ('en-dash', lambda line: line.replace('-', '\u2013')),
+    ('full-width', lambda line: line.translate(
+        {ord(digit): 0xff10 + int(digit) for digit in '0123456789'})),
+    ('fraction slash', lambda line: line.replace('/', '\u2044')),
+    ('ligature', lambda line: line.replace('fl', '\ufb02')),
+    ('bom', lambda line: '\ufeff' + line),
+]
+
+
+def typographic_corpus(size, share=0.1, seed=0):
+    """Return ``(line, ascii_line)`` pairs from ``synthetic_corpus()`` where
+    ``share`` of the lines have had some typography introduced."""
+    rng = random.Random(seed)
+    pairs = []
+    for line in synthetic_corpus(size, seed):
+        typographic = line
+        if rng.random() < share:
+            for _, introduce in rng.sample(typography, 2):
+                typographic = introduce(typographic)
+        pairs.append((typographic, line))
+    return pairs
+
+
+def bench_normalize(pairs, **options):
+    """Lines per second, and the share of lines parsed the same as their
+    ASCII original, with the given options."""
+    parser = Ingreedy(**options)
+    expected = list(Ingreedy().parse_many(line for _, line in pairs))
+    start = time.perf_counter()
+    results = list(parser.parse_many(line for line, _ in pairs))
+    elapsed = time.perf_counter() - start
+    same = sum(result == original
+               for result, original in zip(results, expected))
+    return {'lines_per_sec': len(pairs) / elapsed,
+            'coverage': same / len(pairs)}
+
+
+def test_case_lines():
+    try:
+        from ingreedytest import test_cases
+    except ImportError:  # pytest isn't installed
+        return []
+    return list(test_cases)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def peak_memory(run):
+    """Return the peak traced allocation in bytes while calling ``run``."""
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def node_count(run):
+    """Return how many parse tree nodes are created while calling ``run``."""
+    count = [0]
+    init = Node.__init__
+
+    def counting_init(self, *args, **kwargs):
+        count[0] += 1
+        init(self, *args, **kwargs)
+
+    Node.__init__ = counting_init
+    try:
+        run()
+    finally:
+        Node.__init__ = init
+    return count[0]
+
+
+def bench_parse(lines, repeat=1, **options):
+    """Time ``Ingreedy.parse()`` line by line, one parser for the run."""
+    parser = Ingreedy(**options)
+    clock = time.perf_counter
+    latencies = []
+    start = clock()
+    for _ in range(repeat):
+        for line in lines:
+            before = clock()
+            parser.parse(line)
+            latencies.append(clock() - before)
+    elapsed = clock() - start
+    latencies.sort()
+
+    def run():
+        parser = Ingreedy(**options)
+        for line in lines:
+            parser.parse(line)
+
+    return {
+        'lines': len(latencies),
+        'lines_per_sec': len(latencies) / elapsed,
+        'p50_us': percentile(latencies, 0.50) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+        'peak_bytes': peak_memory(run),
+        'nodes_per_line': node_count(run) / len(lines),
+    }
+
+
+def bench_batch(lines, **options):
+    """Time ``Ingreedy.parse_many()`` over all of ``lines``."""
+    def run():
+        for _ in Ingreedy().parse_many(lines, **options):
+            pass
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    result = {'lines': len(lines), 'lines_per_sec': len(lines) / elapsed}
+    if not options.get('workers'):
+        result['peak_bytes'] = peak_memory(run)
+    return result
+
+
+def bench_columns(lines):
+    """Time ``Ingreedy.parse_columns()`` over all of ``lines``."""
+    def run():
+        Ingreedy().parse_columns(lines)
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    return {'lines': len(lines), 'lines_per_sec': len(lines) / elapsed,
+            'peak_bytes': peak_memory(run)}
+
+
+def bench_unique(lines, **options):
+    """Time ``Ingreedy.parse_unique()`` over all of ``lines``."""
+    stats = DedupStats()
+    start = time.perf_counter()
+    for _ in Ingreedy().parse_unique(lines, stats=stats, **options):
+        pass
+    elapsed = time.perf_counter() - start
+    return {'lines': len(lines), 'lines_per_sec': len(lines) / elapsed,
+            'dedup_ratio': stats.ratio}
+
+
+def bench_file(lines, **options):
+    """Time ``Ingreedy.parse_file()`` over ``lines`` written to a file."""
+    import os
+    import tempfile
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(lines))
+
+        def run():
+            for _ in Ingreedy().parse_file(path, **options):
+                pass
+
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        result = {'lines': len(lines), 'lines_per_sec': len(lines) / elapsed}
+        if not options.get('workers'):
+            result['peak_bytes'] = peak_memory(run)
+        return result
+    finally:
+        os.remove(path)
+
+
+def bench_convert(rows, codes=False):
+    """Time ``convert_quantities()`` on ``rows`` rows of mixed units."""
+    import numpy
+
+    names = list(unit_names) + [None]
+    units = numpy.array(names * (rows // len(names) + 1), dtype=object)[:rows]
+    if codes:
+        index = dict((unit, code) for code, unit in enumerate(unit_names))
+        units = numpy.array([index.get(unit, -1) for unit in units])
+    amounts = numpy.arange(rows, dtype=numpy.float64)
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        convert_quantities(amounts, units, to='metric')
+        best = min(best, time.perf_counter() - start)
+    return {'lines': rows, 'lines_per_sec': rows / best}
+
+
+def bench_typing(lines, make_parse):
+    """Type each of ``lines`` a character at a time, calling the function
+    ``make_parse()`` returns (one per line) on every prefix, and report the
+    keystroke-to-result latency."""
+    clock = time.perf_counter
+    latencies = []
+    for line in lines:
+        parse = make_parse()
+        for end in range(1, len(line) + 1):
+            before = clock()
+            try:
+                parse(line[:end])
+            except Exception:
+                pass  # some prefixes don't parse
+            latencies.append(clock() - before)
+    elapsed = sum(latencies)
+    latencies.sort()
+    return {
+        'lines': len(latencies),
+        'lines_per_sec': len(latencies) / elapsed,
+        'p50_us': percentile(latencies, 0.50) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+    }
+
+
+def bench_memo(lines, runs=3, **options):
+    """Best time per line and peak memory for the grammar path with the
+    given memo policy."""
+    parser = Ingreedy(fast_path=False, **options)
+
+    def run():
+        for line in lines:
+            try:
+                parser.parse(line)
+            except Exception:
+                pass
+
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return {'us_per_line': best / len(lines) * 1e6,
+            'peak_bytes': peak_memory(run)}
+
+
+def bench_budget(line, **options):
+    """Seconds a grammar parse of ``line`` takes before it finishes or runs
+    over the given budget."""
+    parser = Ingreedy(fast_path=False, **options)
+    start = time.perf_counter()
+    try:
+        parser.parse(line)
+    except ParseBudgetExceeded:
+        pass
+    return time.perf_counter() - start
+
+
+def bench_register(count):
+    """Register ``count`` custom unit aliases, in units of four aliases
+    each, and return the seconds it took and what a compile of the grammar
+    with them would cost instead."""
+    Ingreedy.grammar  # compiled before, as in a running service
+    start = time.perf_counter()
+    for unit in range(count // 4):
+        name = 'custom%d' % unit
+        register_unit(name, 'imprecise', [
+            name + 's', name, name.upper(), name[:3] + str(unit) + '.'])
+    registered = time.perf_counter() - start
+    lazy = vars(Ingreedy)['grammar']
+    start = time.perf_counter()
+    Grammar(lazy.rules, **lazy.custom_rules)
+    return {'register_sec': registered,
+            'compile_sec': time.perf_counter() - start}
+
+
+def bench_threads(lines, threads, mode):
+    """Lines per second parsing ``lines`` on ``threads`` threads, either
+    with one shared parser (``parse_many(threads=True)``) or, as callers
+    unsure of thread safety do, a new parser per line."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fresh(line):
+        return Ingreedy().parse(line)
+
+    start = time.perf_counter()
+    if mode == 'shared':
+        for _ in Ingreedy().parse_many(lines, workers=threads,
+                                       chunk_size=250, threads=True):
+            pass
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            for _ in pool.map(fresh, lines, chunksize=250):
+                pass
+    return {'lines_per_sec': len(lines) / (time.perf_counter() - start)}
+
+
+def bench_latency(parser, lines, repeat=100, runs=7):
+    """Return the best mean microseconds per line over ``runs`` runs."""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for line in lines:
+                parser.parse(line)
+        best = min(best, time.perf_counter() - start)
+    return best / (repeat * len(lines)) * 1e6
+
+
+def bench_event_loop(lines, mode, interval=0.001):
+    """Parse ``lines`` inside an event loop while a ticker coroutine wakes
+    every ``interval`` seconds, and report how late the ticks were.
+
+    ``mode`` is 'inline' (``parse()`` in a coroutine, yielding between
+    lines), 'threads' or 'processes' (``parse_many_async()`` with that kind
+    of executor).
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    async def ticker(lags, done):
+        loop = asyncio.get_running_loop()
+        while not done:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - expected))
+
+    async def parse(executor):
+        if mode == 'inline':
+            parser = Ingreedy()
+            for line in lines:
+                parser.parse(line)
+                await asyncio.sleep(0)
+        else:
+            async for _ in Ingreedy().parse_many_async(
+                    lines, executor=executor):
+                pass
+
+    async def run(executor):
+        lags, done = [], []
+        task = asyncio.ensure_future(ticker(lags, done))
+        await asyncio.sleep(interval * 2)
+        start = time.perf_counter()
+        await parse(executor)
+        elapsed = time.perf_counter() - start
+        done.append(True)
+        await task
+        return elapsed, sorted(lags)
+
+    executor = {'inline': lambda: None, 'threads': ThreadPoolExecutor,
+                'processes': ProcessPoolExecutor}[mode]()
+    try:
+        elapsed, lags = asyncio.run(run(executor))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {
+        'lines': len(lines),
+        'lines_per_sec': len(lines) / elapsed,
+        'lag_p50_ms': percentile(lags, 0.50) * 1e3,
+        'lag_p99_ms': percentile(lags, 0.99) * 1e3,
+        'lag_max_ms': lags[-1] * 1e3,
+    }
+
+
+def deep_size(obj):
+    """Return the bytes used by ``obj`` and the containers inside it.
+
+    Strings and numbers are left out: they are shared with the input or
+    interned, and are the same whichever result type holds them.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(value) for value in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item) for item in obj)
+    else:
+        size -= sys.getsizeof(obj)
+    return size
+
+
+def bench_results(lines):
+    """Compare dict results with ``compact=True`` results: deep size and
+    the time to build one from already parsed values."""
+    raw = [([(q['unit'], q['unit_type'], q['amount'])
+             for q in result['quantity']], result['ingredient'])
+           for result in Ingreedy().parse_many(lines)]
+    results = {}
+    for name, compact in [('dict', False), ('compact', True)]:
+        build = Ingreedy(compact=compact)._build_result
+        start = time.perf_counter()
+        built = [build(quantities, ingredient)
+                 for quantities, ingredient in raw]
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'bytes_per_result': sum(map(deep_size, built)) / len(built),
+            'build_ns': elapsed / len(built) * 1e9,
+        }
+    return results
+
+
+def run_suite(size, workers=(), chunk_size=1000):
+    corpus = synthetic_corpus(size)
+    cases = test_case_lines()
+    results = {}
+    if cases:
+        results['test_cases/parse'] = bench_parse(cases, repeat=20)
+        results['test_cases/parse/grammar'] = bench_parse(
+            cases, repeat=20, fast_path=False)
+        results['test_cases/parse/grammar/direct'] = bench_parse(
+            cases, repeat=20, fast_path=False, direct=True)
+        for field in ['quantity', 'ingredient']:
+            for direct in [False, True]:
+                name = 'test_cases/parse/grammar%s/%s' % (
+                    '/direct' if direct else '', field)
+                results[name] = bench_parse(
+                    cases, repeat=20, fast_path=False, direct=direct,
+                    fields=[field])
+    typed = cases + extras + long_lines
+    results['typing/parse'] = bench_typing(typed, lambda: Ingreedy().parse)
+    results['typing/parse/direct'] = bench_typing(
+        typed, lambda: Ingreedy(direct=True).parse)
+    results['typing/session'] = bench_typing(
+        typed, lambda: ParseSession().parse)
+    results['corpus/parse'] = bench_parse(corpus)
+    results['corpus/parse/grammar'] = bench_parse(corpus, fast_path=False)
+    results['corpus/parse/grammar/direct'] = bench_parse(
+        corpus, fast_path=False, direct=True)
+    results['corpus/parse/cached'] = bench_parse(corpus, cache_size=10000)
+    results['corpus/parse/compact'] = bench_parse(corpus, compact=True)
+    results['corpus/parse_many'] = bench_batch(corpus)
+    results['corpus/parse_file'] = bench_file(corpus)
+    results['corpus/parse_columns'] = bench_columns(corpus)
+    results['corpus/parse_unique'] = bench_unique(corpus)
+    results['corpus/parse_unique/spilled'] = bench_unique(
+        corpus, max_distinct=max(1, size // 20))
+    for count in workers:
+        results['corpus/parse_many/workers=%d' % count] = bench_batch(
+            corpus, workers=count, chunk_size=chunk_size)
+        results['corpus/parse_file/workers=%d' % count] = bench_file(
+            corpus, workers=count)
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        results['convert_quantities/names'] = bench_convert(1000000)
+        results['convert_quantities/codes'] = bench_convert(
+            1000000, codes=True)
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'corpus_lines': size,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+        'result_types': bench_results(corpus),
+    }
+
+
+def report(suite, baseline=None):
+    previous = baseline['results'] if baseline else {}
+    print('%-44s %12s %10s %10s %12s %8s' % (
+        'benchmark', 'lines/s', 'p50 us', 'p99 us', 'peak KiB', 'nodes'))
+    for name, result in sorted(suite['results'].items()):
+        line = '%-44s %12.0f %10s %10s %12s %8s' % (
+            name, result['lines_per_sec'],
+            '%.1f' % result['p50_us'] if 'p50_us' in result else '-',
+            '%.1f' % result['p99_us'] if 'p99_us' in result else '-',
+            '%.0f' % (result['peak_bytes'] / 1024)
+            if 'peak_bytes' in result else '-',
+            '%.1f' % result['nodes_per_line']
+            if 'nodes_per_line' in result else '-')
+        if name in previous:
+            line += '  %5.2fx' % (
+                result['lines_per_sec'] / previous[name]['lines_per_sec'])
+        print(line)
+    print()
+    print('%-44s %12s %10s' % ('result type', 'bytes', 'build ns'))
+    for name, result in sorted(suite['result_types'].items()):
+        print('%-44s %12.0f %10.0f' % (
+            name, result['bytes_per_result'], result['build_ns']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='size of the synthetic corpus')
+    parser.add_argument('--workers', type=int, nargs='*', default=[],
+                        help='worker counts to run parse_many(workers=N) with')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run')
+    parser.add_argument('--event-loop', action='store_true',
+                        help='only measure event loop lag while parsing '
+                             'inline and with parse_many_async()')
+    parser.add_argument('--memo', action='store_true',
+                        help='only compare packrat memo policies on short, '
+                             'typical and pathological lines')
+    parser.add_argument('--normalize', action='store_true',
+                        help='only compare speed and coverage with and '
+                             'without normalize=True on typographic lines')
+    parser.add_argument('--budget', action='store_true',
+                        help='only time adversarial lines of growing length '
+                             'with and without a parse budget')
+    parser.add_argument('--threads', type=int, nargs='+', metavar='N',
+                        help='only time thread pools of these sizes sharing '
+                             'one parser, against a parser per line')
+    parser.add_argument('--register', type=int, metavar='N',
+                        help='only time registering N custom unit aliases '
+                             'and parsing with them')
+    parser.add_argument('--numbers', action='store_true',
+                        help='only time lines with written numbers')
+    parser.add_argument('--units', action='store_true',
+                        help='only time unit-heavy and unit-less lines '
+                             'through the full grammar')
+    args = parser.parse_args(argv)
+
+    if args.event_loop:
+        corpus = synthetic_corpus(args.lines) + long_lines * 50
+        print('%-10s %10s %12s %12s %12s' % (
+            'mode', 'lines/s', 'lag p50 ms', 'lag p99 ms', 'lag max ms'))
+        for mode in ['inline', 'threads', 'processes']:
+            result = bench_event_loop(corpus, mode)
+            print('%-10s %10.0f %12.2f %12.2f %12.2f' % (
+                mode, result['lines_per_sec'], result['lag_p50_ms'],
+                result['lag_p99_ms'], result['lag_max_ms']))
+        return
+
+    if args.memo:
+        inputs = [('short', ['2 eggs']), ('typical', test_case_lines())]
+        inputs += [(name, [line]) for name, line in
+                   sorted(pathological.items())]
+        print('%-10s %-18s %12s %10s' % ('input', 'memo', 'us/line',
+                                         'peak KiB'))
+        for name, lines in inputs:
+            for policy, options in memo_policies:
+                result = bench_memo(lines, **options)
+                print('%-10s %-18s %12.1f %10.0f' % (
+                    name, policy, result['us_per_line'],
+                    result['peak_bytes'] / 1024))
+        return
+
+    if args.normalize:
+        print('%-8s %-10s %10s %10s' % ('corpus', 'normalize', 'lines/s',
+                                        'coverage'))
+        for share in [0.0, 0.1, 1.0]:
+            pairs = typographic_corpus(args.lines, share)
+            for normalize in [False, True]:
+                result = bench_normalize(pairs, normalize=normalize)
+                print('%-8s %-10s %10.0f %9.1f%%' % (
+                    '%d%%' % (share * 100), normalize,
+                    result['lines_per_sec'], result['coverage'] * 100))
+        return
+
+    if args.budget:
+        print('%-8s %-18s %10s' % ('chars', 'budget', 'ms'))
+        for repeat in [500, 2000, 8000, 32000]:
+            line = '1,' * repeat
+            for name, options in budgets:
+                print('%-8d %-18s %10.1f' % (
+                    len(line), name, bench_budget(line, **options) * 1e3))
+        return
+
+    if args.threads:
+        gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+        print('%s %s, GIL %s, %s CPUs' % (
+            platform.python_implementation(), sys.version.split()[0],
+            'enabled' if gil else 'disabled', os.cpu_count()))
+        corpus = synthetic_corpus(args.lines)
+        print('%-8s %-10s %10s' % ('threads', 'parser', 'lines/s'))
+        for threads in args.threads:
+            for mode in ['shared', 'per-line']:
+                result = bench_threads(corpus, threads, mode)
+                print('%-8d %-10s %10.0f' % (
+                    threads, mode, result['lines_per_sec']))
+        return
+
+    if args.register:
+        lines = unit_heavy + unit_less + ['3 custom7s thyme',
+                                          '1 CUSTOM12 parsley']
+        grammar_only = Ingreedy(fast_path=False)
+        before = bench_latency(grammar_only, lines)
+        result = bench_register(args.register)
+        print('register %d aliases  %8.2f ms' % (
+            args.register, result['register_sec'] * 1e3))
+        print('grammar compile      %8.2f ms' % (
+            result['compile_sec'] * 1e3))
+        print('grammar parse        %8.1f -> %.1f us/line' % (
+            before, bench_latency(grammar_only, lines)))
+        return
+
+    if args.numbers:
+        for name, options in [('parse', {}),
+                              ('grammar', {'fast_path': False}),
+                              ('grammar/direct', {'fast_path': False,
+                                                  'direct': True})]:
+            print('%-16s %6.1f us/line' % (
+                name, bench_latency(Ingreedy(**options), number_heavy)))
+        return
+
+    if args.units:
+        grammar_only = Ingreedy(fast_path=False)
+        for name, lines in [('unit-heavy', unit_heavy),
+                            ('unit-less', unit_less)]:
+            print('%-10s %6.0f us/line' % (
+                name, bench_latency(grammar_only, lines)))
+        return
+
+    suite = run_suite(args.lines, args.workers, args.chunk_size)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    report(suite, baseline)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(suite, fh, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,25 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import heapq
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from itertools import chain, groupby, islice
+from operator import itemgetter
+
+from parsimonious.exceptions import (
+    IncompleteParseError, ParseError, UndefinedLabel, VisitationError)
+from parsimonious.expressions import (
+    IN_PROGRESS, Compound, Expression, Literal, Lookahead, OneOf, Quantifier,
+    Regex, Sequence)
 from parsimonious.grammar import Grammar
-from parsimonious.nodes import NodeVisitor
+from parsimonious.nodes import Node, NodeVisitor, RegexNode
+
+__version__ = '1.3.8'
 
 number_value = {
     'a': 1,
@@ -37,6 +54,14 @@ number_value = {
     'ninety': 90
 }
 
+# Words that multiply the written number before them: "one hundred", "a
+# dozen". Those worth 100 take a smaller number after them, as in "one
+# hundred and ten".
+number_multiplier = {
+    'hundred': 100,
+    'dozen': 12
+}
+
 unicode_fraction_value = {
     '¼': 1.0/4,
     '½': 1.0/2,
@@ -58,11 +83,954 @@ unicode_fraction_value = {
     '⅞': 7.0/8
 }
 
+# Spellings of each unit, by unit system. Units are recognized by longest
+# match over all of these, followed by a non-letter.
+unit_aliases = {
+    'english': {
+        'calorie': ['calories', 'calorie', 'cal', 'kilocalories',
+                    'kilocalorie', 'kCal', 'kcal'],
+        'cup': ['cups', 'cup(s)', 'cup', 'C.', 'C', 'c.', 'c'],
+        'gallon': ['gallons.', 'gallons', 'gallon(s)', 'gallon.', 'gallon',
+                   'gal.', 'gal'],
+        'ounce': ['ounces', 'ounce(s)', 'ounce.', 'ounce', 'oz.', 'oz'],
+        'pint': ['pints', 'pint(s)', 'pint.', 'pint', 'pt.', 'pt'],
+        'pound': ['pounds', 'pound(s)', 'pound.', 'pound', 'lbs.', 'lbs',
+                  'lb.', 'lb', '#'],
+        'quart': ['quarts', 'quart(s)', 'quart.', 'quart', 'qts.', 'qts',
+                  'qt.', 'qt'],
+        'tablespoon': ['tablespoons', 'tablespoon(s)', 'tablespoon.',
+                       'tablespoon', 'tbspns.', 'tbspns', 'Tbsp.', 'Tbsp',
+                       'tbsp.', 'tbsp', 'TBS.', 'TBS', 'Tbs.', 'Tbs', 'tbs.',
+                       'tbs', 'T.', 'T'],
+        'teaspoon': ['teaspoons', 'teaspoon(s)', 'teaspoon', 'teasps.',
+                     'teasps', 'teasp.', 'teasp', 'tsp.', 'tsp', 't.', 't'],
+    },
+    'metric': {
+        'gram': ['grams', 'gram(s)', 'gram', 'gr.', 'gr', 'G.', 'G', 'g.',
+                 'g'],
+        'joule': ['joules', 'joule(s)', 'joule', 'j'],
+        'kilogram': ['kilograms', 'kilogram(s)', 'kilogram', 'KG.', 'KG',
+                     'Kg.', 'Kg', 'kg.', 'kg'],
+        'kilojoule': ['kilojoules', 'kilojoule(s)', 'kilojoule', 'kJ', 'kj'],
+        'liter': ['liters', 'liter(s)', 'liter', 'L.', 'L', 'l.', 'l'],
+        'milligram': ['milligrams', 'milligram(s)', 'milligram', 'mgs.',
+                      'mgs', 'mg.', 'mg'],
+        'milliliter': ['milliliters', 'milliliter(s)', 'milliliter', 'mls.',
+                       'mls', 'ml.', 'ml'],
+    },
+    'imprecise': {
+        'dash': ['dashes', 'dash'],
+        'handful': ['handfuls', 'handful'],
+        'head': ['heads', 'head'],
+        'pinch': ['pinches', 'pinch'],
+        'punnet': ['punnetts', 'punnett', 'punnets', 'punnet'],
+        'stick': ['sticks', 'stick(s)', 'stick'],
+        'touch': ['touches', 'touch'],
+    },
+}
+
+# "fl oz", "fluid-ounce", ...: any fluid spelling, a break, then an ounce.
+unit_aliases['english']['fluid_ounce'] = [
+    fluid + separator + ounce
+    for fluid in ('fluid', 'fl.', 'fl')
+    for separator in (' ', ',', '-', '\t')
+    for ounce in unit_aliases['english']['ounce']
+]
+
+# What each precise unit measures and how many of that dimension's base
+# unit (gram, milliliter, calorie) it is. Volumes are US customary, and a
+# recipe "calorie" is a food calorie, so the energy base is the kilocalorie.
+unit_factors = {
+    'calorie': ('energy', 1.0),
+    'cup': ('volume', 236.5882365),
+    'fluid_ounce': ('volume', 29.5735295625),
+    'gallon': ('volume', 3785.411784),
+    'gram': ('mass', 1.0),
+    'joule': ('energy', 1 / 4184.0),
+    'kilogram': ('mass', 1000.0),
+    'kilojoule': ('energy', 1 / 4.184),
+    'liter': ('volume', 1000.0),
+    'milligram': ('mass', 0.001),
+    'milliliter': ('volume', 1.0),
+    'ounce': ('mass', 28.349523125),
+    'pint': ('volume', 473.176473),
+    'pound': ('mass', 453.59237),
+    'quart': ('volume', 946.352946),
+    'tablespoon': ('volume', 14.78676478125),
+    'teaspoon': ('volume', 4.92892159375),
+}
+
+# The unit each dimension is converted to by convert_quantities(to=...).
+conversion_targets = {
+    'base': {'mass': 'gram', 'volume': 'milliliter', 'energy': 'calorie'},
+    'metric': {'mass': 'gram', 'volume': 'milliliter',
+               'energy': 'kilojoule'},
+    'english': {'mass': 'ounce', 'volume': 'fluid_ounce',
+                'energy': 'calorie'},
+}
+
+# Every canonical unit. Units are dictionary-encoded as indexes into this
+# tuple, with -1 for no unit.
+unit_names = tuple(sorted(
+    unit for units in unit_aliases.values() for unit in units))
+unit_types = tuple(sorted(unit_aliases))
+
+# Unit and number tables for languages other than English ('en', the
+# tables above), in the same shapes. A parser for one of these gets a grammar
+# of its own, compiled the first time that locale is asked for, whose letters
+# also cover accented Latin ones.
+locales = {
+    'cs': {
+        'unit_aliases': {
+            'english': {
+                'cup': ['hrnky', 'hrnků', 'hrnku', 'hrnek', 'hrn.'],
+                'tablespoon': ['polévkových lžic', 'polévkové lžíce',
+                               'polévková lžíce', 'lžíce', 'lžic', 'PL',
+                               'pl.', 'pl'],
+                'teaspoon': ['čajových lžiček', 'čajové lžičky',
+                             'čajová lžička', 'lžičky', 'lžička', 'lžiček',
+                             'ČL', 'čl.', 'čl', 'KL', 'kl.', 'kl'],
+            },
+            'metric': dict(unit_aliases['metric']),
+            'imprecise': {
+                'dash': ['střiky', 'střik'],
+                'handful': ['hrsti', 'hrstí', 'hrst'],
+                'head': ['hlávky', 'hlávka', 'hlávek'],
+                'pinch': ['špetky', 'špetka', 'špetek', 'špetku'],
+            },
+        },
+        'number_value': {
+            'jeden': 1, 'jedna': 1, 'jedno': 1, 'dva': 2, 'dvě': 2, 'tři': 3,
+            'čtyři': 4, 'pět': 5, 'šest': 6, 'sedm': 7, 'osm': 8, 'devět': 9,
+            'deset': 10, 'jedenáct': 11, 'dvanáct': 12, 'třináct': 13,
+            'čtrnáct': 14, 'patnáct': 15, 'šestnáct': 16, 'sedmnáct': 17,
+            'osmnáct': 18, 'devatenáct': 19, 'dvacet': 20, 'třicet': 30,
+            'čtyřicet': 40, 'padesát': 50, 'šedesát': 60, 'sedmdesát': 70,
+            'osmdesát': 80, 'devadesát': 90,
+        },
+        'number_multiplier': {'tucet': 12, 'tucty': 12, 'tuctů': 12},
+    },
+}
+
+# Typography the grammar has no rules for, rewritten by normalize(): dashes
+# to hyphens, slashes to "/" and invisible characters to nothing. The rest of
+# the table comes from NFKC, see _normalization_table().
+normalized_characters = {
+    '\u2010': '-', '\u2011': '-', '\u2012': '-', '\u2013': '-',
+    '\u2014': '-', '\u2015': '-', '\u2212': '-', '\ufe58': '-',
+    '\ufe63': '-', '\u2044': '/', '\u2215': '/', '\u00ad': '',
+    '\u200b': '', '\u200c': '', '\u200d': '', '\u2060': '', '\ufeff': '',
+}
+
+
+def normalize(text):
+    """Return ``text`` in the canonical form ``Ingreedy(normalize=True)``
+    parses: non-breaking and other unusual spaces become " ", dashes "-",
+    full-width forms and letter ligatures their ASCII equivalents, and
+    invisible characters are dropped. Vulgar fractions and superscripts are
+    left alone, as NFKC would change what they mean ("1½" to "11⁄2").
+    """
+    if text.isascii():
+        return text
+    return text.translate(_normalization_table())
+
+
+def normalized_offsets(text):
+    """Return, for each index into ``normalize(text)`` and its end, the
+    index into ``text`` it came from."""
+    table = _normalization_table()
+    offsets = []
+    for index, char in enumerate(text):
+        offsets.extend([index] * len(table.get(ord(char), char)))
+    offsets.append(len(text))
+    return offsets
+
+
+_normalization = {}
+
+
+def _normalization_table():
+    # Built on first use: every BMP character that NFKC turns into ASCII
+    # without changing its meaning, plus normalized_characters.
+    table = _normalization.get('table')
+    if table is None:
+        table = {}
+        for code in range(0x80, 0x10000):
+            char = chr(code)
+            tag = unicodedata.decomposition(char).split(' ', 1)[0]
+            if tag not in ('<wide>', '<narrow>', '<noBreak>', '<compat>'):
+                continue
+            if tag == '<compat>' and \
+                    unicodedata.category(char)[0] not in 'LZ':
+                continue  # roman numerals, ellipses, ...
+            replacement = unicodedata.normalize('NFKC', char)
+            if replacement.isascii():
+                table[code] = replacement
+        for char, replacement in normalized_characters.items():
+            table[ord(char)] = replacement
+        table = _normalization['table'] = table
+    return table
+
+
+class UnitNode(Node):
+    """Node returned from a ``_UnitExpression``, carrying the canonical unit
+    name and unit system it matched"""
+    __slots__ = ['unit']
+
+
+class _UnitExpression(Expression):
+    """Longest-match lookup of every alias in a ``unit_aliases`` style table.
+
+    The aliases are kept in a character trie, so recognizing a unit (or
+    failing to) takes a single scan of the text however many aliases there
+    are. Like the grammar's other unit rules, a match is only a unit if no
+    letter follows it; callers check that with ``!letter``.
+    """
+    __slots__ = ['trie']
+
+    def __init__(self, systems, name=''):
+        super(_UnitExpression, self).__init__(name)
+        self.trie = {}
+        for system, units in sorted(systems.items()):
+            for unit, aliases in sorted(units.items()):
+                self._insert(aliases, unit, system)
+        self.identity_tuple = (self.name, repr(self.trie))
+
+    def add(self, aliases, unit, system):
+        """Recognize each of ``aliases`` as ``unit`` of ``system`` from now
+        on, taking over any alias already in use."""
+        self._insert(aliases, unit, system)
+        # Cheaper than repr(self.trie) again, and just as distinguishing.
+        self.identity_tuple += ((tuple(aliases), unit, system),)
+
+    def _insert(self, aliases, unit, system):
+        for alias in aliases:
+            node = self.trie
+            for char in alias:
+                node = node.setdefault(char, {})
+            node[''] = (unit, system)
+
+    def match_unit(self, text, pos):
+        """Return ``(end, (unit, system))`` for the longest alias at ``pos``,
+        or None."""
+        node = self.trie
+        found = None
+        for end in range(pos, len(text)):
+            node = node.get(text[end])
+            if node is None:
+                break
+            if '' in node:
+                found = end + 1, node['']
+        return found
+
+    def reach(self, text, pos):
+        """Return the end of what ``match_unit(text, pos)`` looks at, with
+        ``len(text) + 1`` meaning it ran into the end of the text."""
+        node = self.trie
+        for end in range(pos, len(text)):
+            node = node.get(text[end])
+            if node is None:
+                return end + 1
+        return len(text) + 1
+
+    def _uncached_match(self, text, pos, cache, error):
+        found = self.match_unit(text, pos)
+        if found is not None:
+            node = UnitNode(self, text, pos, found[0])
+            node.unit = found[1]
+            return node
+
+    def _as_rhs(self):
+        return '{unit lookup}'
+
+
+class NumberNode(Node):
+    """Node returned from a ``_WrittenNumberExpression``, carrying the value
+    of the number it matched"""
+    __slots__ = ['value']
+
+
+_letters = re.compile(r'[^\W\d_]*')
+
+
+class _WrittenNumberExpression(Expression):
+    """Word-level lookup of written numbers, valued from ``number_value``
+    and ``number_multiplier``.
+
+    Each word is read whole and looked up, so "an" and "eighteen" aren't
+    cut short at "a" and "eight" as an ordered choice of literals would be.
+    One scan also joins compounds separated by a space or hyphen: "twenty
+    five", "one hundred and ten", "two dozen". A match never includes the
+    break after its last word.
+    """
+    __slots__ = ['values', 'multipliers']
+    articles = frozenset(['a', 'an'])
+
+    def __init__(self, values, multipliers, name=''):
+        super(_WrittenNumberExpression, self).__init__(name)
+        self.values = dict(values)
+        self.multipliers = dict(multipliers)
+        self.identity_tuple = (self.name, repr(sorted(self.values.items())),
+                               repr(sorted(self.multipliers.items())))
+
+    def match_number(self, text, pos):
+        """Return ``(end, value)`` for the written number at ``pos``, or
+        None."""
+        return self._scan(text, pos)[0]
+
+    def reach(self, text, pos):
+        """Return the end of what ``match_number(text, pos)`` looks at, with
+        ``len(text) + 1`` meaning it ran into the end of the text."""
+        return self._scan(text, pos)[1]
+
+    def _scan(self, text, pos):
+        reach = [pos + 1]
+        found = self._below_hundred(text, pos, reach, True)
+        if found is None:
+            return None, reach[0]
+        end, value = found
+        multipliers = self.multipliers
+        word, stop = self._word_after(text, end, reach)
+        if multipliers.get(word) == 100 and 0 < value < 10:
+            end, value = stop, value * multipliers[word]
+            word, stop = self._word_after(text, end, reach)
+            rest = stop if word == 'and' else end
+            if text[rest:rest + 1] in (' ', '-'):
+                found = self._below_hundred(text, rest + 1, reach, False)
+                if found is not None and found[1]:
+                    end, value = found[0], value + found[1]
+            word, stop = self._word_after(text, end, reach)
+        if word in multipliers:
+            end, value = stop, value * multipliers[word]
+        return (end, value), reach[0]
+
+    def _below_hundred(self, text, pos, reach, first):
+        # A number word, or tens and units: "twenty-five".
+        stop = _letters.match(text, pos).end()
+        reach[0] = max(reach[0], stop + 1)
+        word = text[pos:stop]
+        value = self.values.get(word)
+        if value is None or not first and word in self.articles:
+            return None
+        if value >= 20 and not value % 10:
+            unit, after = self._word_after(text, stop, reach)
+            units = self.values.get(unit, 0)
+            if 0 < units < 10 and unit not in self.articles:
+                return after, value + units
+        return stop, value
+
+    def _word_after(self, text, end, reach):
+        # The word after a separator at end, and where it stops.
+        if text[end:end + 1] not in (' ', '-'):
+            return None, end
+        stop = _letters.match(text, end + 1).end()
+        reach[0] = max(reach[0], stop + 1)
+        return text[end + 1:stop], stop
+
+    def _uncached_match(self, text, pos, cache, error):
+        found = self.match_number(text, pos)
+        if found is not None:
+            node = NumberNode(self, text, pos, found[0])
+            node.value = found[1]
+            return node
+
+    def _as_rhs(self):
+        return '{written number lookup}'
+
+
+# Yielded by Ingreedy.parse_many() in place of a result for lines that could
+# not be parsed; ``pos`` is None when the failure happened during visitation
+# or the line ran over the parser's budget.
+ParseFailure = namedtuple('ParseFailure', ['index', 'text', 'pos', 'error'])
+
+
+class ParseBudgetExceeded(ParseError):
+    """A line needed more than the parser's ``max_length``, ``max_steps`` or
+    ``timeout`` allow; ``limit`` is which of those, ``value`` its setting."""
+
+    def __init__(self, text, limit, value):
+        super(ParseBudgetExceeded, self).__init__(text, None)
+        self.limit = limit
+        self.value = value
+
+    def __str__(self):
+        return 'Parse of a %d character line ran over %s=%s' % (
+            len(self.text), self.limit, self.value)
+
+
+class Quantity(namedtuple('Quantity', ['unit', 'unit_type', 'amount'])):
+    """One parsed quantity, as returned by ``Ingreedy(compact=True)``"""
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'unit': self.unit,
+            'unit_type': self.unit_type,
+            'amount': self.amount
+        }
+
+
+class ParseResult(namedtuple('ParseResult', ['quantity', 'ingredient'])):
+    """A parsed line, as returned by ``Ingreedy(compact=True)``
+
+    ``quantity`` is a tuple of ``Quantity``. Both are tuples underneath, so a
+    result takes a fraction of the memory of the equivalent nested dicts.
+    """
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'quantity': None if self.quantity is None else [
+                quantity.to_dict() for quantity in self.quantity],
+            'ingredient': self.ingredient
+        }
+
+
+# Result fields that Ingreedy(fields=...) can select.
+_all_fields = frozenset(['quantity', 'ingredient'])
+_quantity_only = frozenset(['quantity'])
+_ingredient_only = frozenset(['ingredient'])
+
+
+class Columns(object):
+    """Parsed lines in columnar buffers, from ``Ingreedy.parse_columns()``.
+
+    The quantities of line ``i`` are rows ``quantity_offsets[i]`` up to
+    ``quantity_offsets[i + 1]`` of ``amount`` (float64), ``unit`` (int32
+    codes into ``unit_names``) and ``unit_type`` (int8 codes into
+    ``unit_types``), where -1 stands for None. Its ingredient is the UTF-8
+    ``ingredient_data[ingredient_offsets[i]:ingredient_offsets[i + 1]]``,
+    and ``ingredient_valid[i]`` is 0 when it is None. ``valid[i]`` is 0 for
+    lines that failed to parse; their ``ParseFailure`` is in ``failures``.
+
+    The buffers are ``array.array`` and ``bytearray`` objects, so
+    ``numpy.frombuffer()`` or ``pyarrow.py_buffer()`` can wrap them without
+    copying, as ``to_numpy()`` and ``to_arrow()`` do.
+    """
+
+    def __init__(self):
+        from array import array
+
+        self.amount = array('d')
+        self.unit = array('i')
+        self.unit_type = array('b')
+        self.quantity_offsets = array('q', [0])
+        self.ingredient_data = bytearray()
+        self.ingredient_offsets = array('q', [0])
+        self.ingredient_valid = array('b')
+        self.valid = array('b')
+        self.failures = []
+
+    def __len__(self):
+        return len(self.valid)
+
+    def to_numpy(self):
+        """Return the buffers as a dict of NumPy arrays sharing their
+        memory."""
+        numpy = _numpy()
+        return {
+            'amount': numpy.frombuffer(self.amount, numpy.float64),
+            'unit': numpy.frombuffer(self.unit, numpy.int32),
+            'unit_type': numpy.frombuffer(self.unit_type, numpy.int8),
+            'quantity_offsets': numpy.frombuffer(
+                self.quantity_offsets, numpy.int64),
+            'ingredient_data': numpy.frombuffer(
+                self.ingredient_data, numpy.uint8),
+            'ingredient_offsets': numpy.frombuffer(
+                self.ingredient_offsets, numpy.int64),
+            'ingredient_valid': numpy.frombuffer(
+                self.ingredient_valid, numpy.bool_),
+            'valid': numpy.frombuffer(self.valid, numpy.bool_),
+        }
+
+    def to_arrow(self):
+        """Return a ``pyarrow.Table`` with a row per line, shaped like the
+        dict results, with dictionary-encoded units. The amount, offset and
+        ingredient buffers are shared rather than copied."""
+        import pyarrow
+
+        numpy = _numpy()
+        columns = self.to_numpy()
+        lines = len(self)
+
+        def bitmap(valid):
+            return pyarrow.py_buffer(
+                numpy.packbits(valid, bitorder='little').tobytes())
+
+        def codes(values, names):
+            return pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(values, mask=values < 0),
+                pyarrow.array(names, pyarrow.string()))
+
+        quantity = pyarrow.StructArray.from_arrays(
+            [codes(columns['unit'], unit_names),
+             codes(columns['unit_type'], unit_types),
+             pyarrow.Array.from_buffers(
+                 pyarrow.float64(), len(self.amount),
+                 [None, pyarrow.py_buffer(self.amount)])],
+            ['unit', 'unit_type', 'amount'])
+        quantities = pyarrow.Array.from_buffers(
+            pyarrow.large_list(quantity.type), lines,
+            [bitmap(columns['valid']),
+             pyarrow.py_buffer(self.quantity_offsets)],
+            children=[quantity])
+        ingredients = pyarrow.Array.from_buffers(
+            pyarrow.large_string(), lines,
+            [bitmap(columns['ingredient_valid']),
+             pyarrow.py_buffer(self.ingredient_offsets),
+             pyarrow.py_buffer(self.ingredient_data)])
+        return pyarrow.Table.from_arrays(
+            [quantities, ingredients], ['quantity', 'ingredient'])
+
+
+CacheInfo = namedtuple(
+    'CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class DedupStats(object):
+    """Counts collected by ``Ingreedy.parse_unique(stats=...)``.
+
+    ``lines`` lines were read, of which ``distinct`` were parsed; ``spilled``
+    of the lines went through the on-disk sort. ``ratio`` is the number of
+    lines served per parse.
+    """
+
+    def __init__(self):
+        self.lines = self.distinct = self.spilled = 0
+
+    @property
+    def ratio(self):
+        return self.lines / self.distinct if self.distinct else 0.0
+
+    def __repr__(self):
+        return 'DedupStats(lines=%d, distinct=%d, spilled=%d, ratio=%.2f)' % (
+            self.lines, self.distinct, self.spilled, self.ratio)
+
+
+class ParseProfile(object):
+    """Where parse time goes, collected by ``Ingreedy(profile=...)``.
+
+    ``rules`` maps each grammar expression (by rule name, or by its rule text
+    when it is an unnamed subexpression) to ``[attempts, matched, failed]``;
+    attempts that are neither were answered from the packrat cache.
+    ``visits`` maps each visit_* method name to ``[calls, seconds]``. Counts
+    accumulate over every parse until ``clear()``. Lines answered by the fast
+    path are counted under ``'<fast path>'``.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.rules = {}
+        self.visits = {}
+        self._counts = {}
+        self._grammar = None
+
+    def report(self, top=10):
+        """Return the ``top`` busiest rules and slowest visit methods as a
+        printable table."""
+        lines = ['%-36s %10s %10s %10s %10s' % (
+            'rule', 'attempts', 'memo hits', 'matched', 'failed')]
+        for label, (attempts, matched, failed) in sorted(
+                self.rules.items(), key=lambda item: -item[1][0])[:top]:
+            lines.append('%-36s %10d %10d %10d %10d' % (
+                label[:36], attempts, attempts - matched - failed, matched,
+                failed))
+        lines.append('')
+        lines.append('%-36s %10s %10s %10s' % (
+            'visit method', 'calls', 'total ms', 'mean us'))
+        for name, (calls, seconds) in sorted(
+                self.visits.items(), key=lambda item: -item[1][1])[:top]:
+            lines.append('%-36s %10d %10.2f %10.2f' % (
+                name[:36], calls, seconds * 1e3, seconds / calls * 1e6))
+        return '\n'.join(lines)
+
+    def _cache(self, grammar, memoized=None, limit=None,
+               cache_class=None):
+        # A packrat cache for one parse that counts what the grammar does.
+        if self._grammar is not grammar:
+            self._grammar = grammar
+            self._counts = {}
+            for expression in _expressions(grammar):
+                label = expression.name or expression.as_rule()
+                self._counts[id(expression)] = self.rules.setdefault(
+                    label, [0, 0, 0])
+        return (cache_class or _ProfilingCache)(
+            memoized, limit, self._counts)
+
+    def _timed(self, name, method):
+        clock = time.perf_counter
+
+        def timed(node, visited_children):
+            start = clock()
+            try:
+                return method(node, visited_children)
+            finally:
+                counts = self.visits.setdefault(name, [0, 0.0])
+                counts[0] += 1
+                counts[1] += clock() - start
+        return timed
+
+
+class _PolicyCache(dict):
+    # Packrat cache that only memoizes the expressions whose ids are in
+    # ``memoized`` (all if None), and at most ``limit`` entries in all.
+    # Expression.match_core() looks itself up here once per attempt, then
+    # stores each fresh result in the per-expression dict it got back.
+    def __init__(self, memoized=None, limit=None, counts=None):
+        dict.__init__(self)
+        self.memoized = memoized
+        self.budget = [float('inf') if limit is None else limit]
+        self.counts = counts
+
+    def __missing__(self, key):
+        store = self.memoized is None or key in self.memoized
+        if self.counts is None and self.budget[0] == float('inf'):
+            # Nothing to count: plain dicts keep this at C speed.
+            memo = self[key] = {} if store else _no_memo
+            return memo
+        memo = self[key] = _Memo()
+        memo.store = store
+        memo.budget = self.budget
+        memo.counts = None if self.counts is None else (
+            self.counts.get(key) or [0, 0, 0])
+        return memo
+
+
+class _ProfilingCache(_PolicyCache):
+    # Also counts attempts, matches and failures per expression.
+    def __getitem__(self, key):
+        memo = dict.__getitem__(self, key)
+        memo.counts[0] += 1
+        return memo
+
+
+class _BudgetCache(_PolicyCache):
+    # Also raises ParseBudgetExceeded once the parse has taken more than
+    # ``max_steps`` steps (one per expression attempt: a lookup here, or a
+    # step() call from the direct evaluator for expressions it doesn't
+    # memoize) or is past ``deadline``, which is checked every 64 steps.
+    max_steps = float('inf')
+    deadline = None
+    timeout = None
+
+    def __getitem__(self, key):
+        self.step()
+        return dict.__getitem__(self, key)
+
+    def step(self):
+        self.steps += 1
+        if self.steps > self.max_steps:
+            raise ParseBudgetExceeded(self.text, 'max_steps', self.max_steps)
+        if not self.steps & 63 and self.deadline is not None and \
+                time.perf_counter() > self.deadline:
+            raise ParseBudgetExceeded(self.text, 'timeout', self.timeout)
+
+
+class _ProfilingBudgetCache(_BudgetCache):
+    def __getitem__(self, key):
+        memo = _BudgetCache.__getitem__(self, key)
+        memo.counts[0] += 1
+        return memo
+
+
+class _NoMemo(dict):
+    __slots__ = []
+
+    def __setitem__(self, pos, node):
+        pass
+
+
+_no_memo = _NoMemo()
+
+
+class _Memo(dict):
+    __slots__ = ['store', 'budget', 'counts']
+
+    def __setitem__(self, pos, node):
+        if self.counts is not None and node is not IN_PROGRESS:
+            self.counts[1 if node is not None else 2] += 1
+        if pos in self:
+            dict.__setitem__(self, pos, node)
+        elif self.store and self.budget[0] > 0:
+            # IN_PROGRESS is stored under the same terms, so it is never
+            # left behind without its result.
+            self.budget[0] -= 1
+            dict.__setitem__(self, pos, node)
+
+
+def _expressions(grammar):
+    seen = {}
+    stack = list(grammar.values())
+    while stack:
+        expression = stack.pop()
+        if id(expression) not in seen:
+            seen[id(expression)] = expression
+            if isinstance(expression, Compound):
+                stack.extend(expression.members)
+    return seen.values()
+
+
+class ParseSession(object):
+    """Re-parses one line as it is edited, reusing the previous parse.
+
+    ``parse(text)`` returns (or raises) what ``parser.parse(text)`` would.
+    The session keeps the packrat memo of its last parse, with each entry
+    recording how far into the text its match looked. After an edit, the
+    entries that looked only at the part before the first changed character
+    are kept and the rest are dropped, so typing at the end of a line only
+    re-matches its tail. The parser's ``max_length``, ``max_steps`` and
+    ``timeout`` apply as they do to its own parses, steps counting only
+    what is re-matched.
+    """
+
+    def __init__(self, parser=None):
+        self.parser = Ingreedy() if parser is None else parser
+        self.text = ''
+        self._cache = _ReachCache()
+        self._units_version = _units_version
+
+    def parse(self, text):
+        parser = self.parser
+        if parser.max_length is not None and len(text) > parser.max_length:
+            raise ParseBudgetExceeded(text, 'max_length', parser.max_length)
+        line = normalize(text) if parser.normalize else text
+        fast_path = _fast_path(parser.grammar)
+        if fast_path is None:
+            return parser.parse(text)  # direct evaluation needs the lookups
+        if parser.fast_path and _visits_like_ingreedy(type(parser)):
+            parsed = fast_path.parse(line)
+            if parsed is not None:
+                return parser._selected_result(*parsed)
+        budgeted = parser.max_steps is not None or parser.timeout is not None
+        if budgeted != isinstance(self._cache, _BudgetReachCache):
+            self._cache = _BudgetReachCache() if budgeted else _ReachCache()
+            self.text = ''
+        self._forget(line)
+        if budgeted:
+            parser._start_budget(self._cache, text)
+        evaluator = _shared_evaluator(
+            parser.grammar, type(parser), parser.fields, track_reach=True,
+            budgeted=budgeted)
+        try:
+            value = evaluator.evaluate(line, self._cache, parser)
+        except ParseBudgetExceeded:
+            raise
+        except Exception:
+            return parser.parse(text)  # raises the usual error
+        if parser.fields == _quantity_only:
+            return parser._build_result(value, None)
+        return _copy_result(value)  # the memo keeps the original
+
+    def _forget(self, text):
+        # Drop the memo entries that looked past the common prefix, or all
+        # of them once register_unit() has been called.
+        if self._units_version != _units_version:
+            self._units_version = _units_version
+            self._cache.clear()
+            self.text = ''
+        old = self.text
+        if old == text:
+            return
+        self.text = text
+        common = min(len(old), len(text))
+        for pos in range(common):
+            if old[pos] != text[pos]:
+                common = pos
+                break
+        for memo in self._cache.values():
+            stale = [pos for pos, entry in memo.items() if entry[1] > common]
+            for pos in stale:
+                del memo[pos]
+        self._cache.reach = 0
+
+
+# The rules whose packrat memo entries actually get reused, measured with
+# ParseProfile over the test cases; for Ingreedy(memo_rules=...).
+selective_memo_rules = frozenset([
+    'amount', 'break', 'catch_all', 'fraction', 'integer', 'open', 'unit'])
+
+
+# Directory where compiled grammars are pickled, keyed by a hash of the
+# grammar text, so new processes can skip compiling them. Off by default.
+grammar_cache_dir = os.environ.get('INGREEDYPY_GRAMMAR_CACHE')
+
+
+class _LazyGrammar(object):
+    """Class attribute that compiles its grammar on first access.
+
+    Importing the module stays cheap; the first parse pays for the compile,
+    or for loading it from ``grammar_cache_dir`` when that is set.
+    """
+
+    def __init__(self, rules, **custom_rules):
+        self.rules = rules
+        self.custom_rules = custom_rules
+        self.grammar = None
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        grammar = self.grammar
+        if grammar is None:
+            with self.lock:
+                if self.grammar is None:
+                    self.grammar = _load_grammar(
+                        self.rules, self.custom_rules)
+                grammar = self.grammar
+        return grammar
+
+
+def _load_grammar(rules, custom_rules):
+    if not grammar_cache_dir:
+        return Grammar(rules, **custom_rules)
+    import hashlib
+    import pickle
+    import sys
+    import tempfile
+
+    try:
+        # A pickle is only good for the versions that wrote it.
+        key = '\n'.join([
+            rules, __version__, _parsimonious_version(), sys.version,
+        ]).encode('utf-8') + pickle.dumps(
+            sorted(custom_rules.items()), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return Grammar(rules, **custom_rules)  # custom rules can't pickle
+    digest = hashlib.sha256(key).hexdigest()[:16]
+    path = os.path.join(grammar_cache_dir, 'ingreedypy-%s.pickle' % digest)
+    try:
+        with open(path, 'rb') as fh:
+            grammar = pickle.load(fh)
+        if isinstance(grammar, Grammar):
+            return grammar
+    except Exception:
+        pass
+    grammar = Grammar(rules, **custom_rules)
+    tmp = None
+    try:
+        os.makedirs(grammar_cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=grammar_cache_dir)
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump(grammar, fh, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception:
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return grammar
+
+
+def _parsimonious_version():
+    try:
+        from importlib.metadata import version
+        return version('parsimonious')
+    except Exception:
+        return 'unknown'
+
+
+_locale_grammars = {}
+
+
+def _locale_grammar(cls, locale):
+    # cls's grammar with the unit, number and letter rules of locale.
+    lazy = next(vars(klass)['grammar'] for klass in cls.__mro__
+                if 'grammar' in vars(klass))
+    if not isinstance(lazy, _LazyGrammar):
+        raise ValueError('%s.grammar has no locales' % cls.__name__)
+    key = lazy, locale
+    grammar = _locale_grammars.get(key)
+    if grammar is None:
+        tables = locales[locale]
+        units = tables['unit_aliases']
+        custom_rules = dict(
+            lazy.custom_rules,
+            unit=_UnitExpression(units, name='unit'),
+            imprecise_unit=_UnitExpression(
+                {'imprecise': units.get('imprecise', {})},
+                name='imprecise_unit'),
+            written_number=_WrittenNumberExpression(
+                tables['number_value'], tables.get('number_multiplier', {}),
+                name='written_number'),
+            letter=Regex('[a-zA-ZÀ-ÖØ-öø-ɏ]', name='letter'))
+        grammar = _locale_grammars.setdefault(
+            key, _LazyGrammar(lazy.rules, **custom_rules))
+    return grammar.__get__(None, cls)
+
+
+_registry_lock = threading.Lock()
+# Bumped by register_unit(), so that parsers drop the results they cached.
+_units_version = 0
+# The arguments of every register_unit() call so far, in order, for worker
+# processes to replay; see _replay_units().
+_registered_units = []
+
+
+def register_unit(unit, unit_type, aliases, locale='en'):
+    """Recognize ``aliases`` as spellings of ``unit`` in every ``Ingreedy``
+    parser for ``locale``, reported with ``unit_type`` (a unit system such
+    as 'english', 'metric' or 'imprecise', or a new one).
+
+    The aliases go straight into the unit lookups of the grammar, compiled
+    or not, so nothing is recompiled, and an alias already in use is taken
+    over. A new unit is appended to ``unit_names`` and a new unit type to
+    ``unit_types``, so existing codes stay the same. Results cached by
+    parsers with a ``cache_size`` are dropped. The worker processes of
+    ``parse_many()``, ``parse_file()`` and the async methods are sent the
+    registrations, so they parse alike whatever their start method.
+    """
+    global unit_names, unit_types, _units_version
+    aliases = list(aliases)
+    if not aliases or not all(aliases):
+        raise ValueError('aliases must be non-empty strings, not %r' % (
+            aliases,))
+    with _registry_lock:
+        if locale == 'en':
+            tables = unit_aliases
+            lazies = [vars(Ingreedy)['grammar']]
+        else:
+            tables = locales[locale]['unit_aliases']
+            lazies = [lazy for (_, name), lazy in _locale_grammars.items()
+                      if name == locale]
+        units = tables.setdefault(unit_type, {})
+        known = units.get(unit, [])
+        units[unit] = known + [alias for alias in aliases
+                               if alias not in known]
+        rules = ['unit', 'imprecise_unit'] if unit_type == 'imprecise' \
+            else ['unit']
+        expressions = dict(
+            (id(grammar[rule]), grammar[rule])
+            for lazy in lazies
+            for grammar in (lazy.custom_rules, lazy.grammar)
+            if grammar is not None for rule in rules)
+        for expression in expressions.values():
+            expression.add(aliases, unit, unit_type)
+        if unit not in unit_names:
+            unit_names += (unit,)
+        if unit_type not in unit_types:
+            unit_types += (unit_type,)
+        _registered_units.append((unit, unit_type, tuple(aliases), locale))
+        _units_version += 1
+
+
+_replay_lock = threading.Lock()
+
+
+def _replay_units(registrations):
+    # Makes the register_unit() calls in registrations that this process
+    # hasn't: all of them in a spawned worker, none in a forked one.
+    if len(registrations) > len(_registered_units):
+        with _replay_lock:
+            for registration in registrations[len(_registered_units):]:
+                register_unit(*registration)
+
 
 class Ingreedy(NodeVisitor):
     """Visitor that turns a parse tree into HTML fragments"""
 
-    grammar = Grammar(
+    grammar = _LazyGrammar(
         """
         ingredient_addition = multipart_quantity alternative_quantity? break? ingredient? catch_all
 
@@ -170,277 +1138,15 @@ class Ingreedy(NodeVisitor):
         hyphen
         = "-"
 
-        unit
-        = english_unit
-        / metric_unit
-        / imprecise_unit
-        # / abbreviated_unit
-
-        english_unit
-        = calorie
-        / cup
-        / fluid_ounce
-        / gallon
-        / ounce
-        / pint
-        / pound
-        / quart
-        / tablespoon
-        / teaspoon
-
-        cup
-        = "cups"
-        / "cup(s)"
-        / "cup"
-        / "C."
-        / "C"
-        / "c."
-        / "c"
-
-        fluid_ounce
-        = fluid break ounce
-
-        fluid
-        = "fluid"
-        / "fl."
-        / "fl"
-
-        gallon
-        = "gallons."
-        / "gallons"
-        / "gallon(s)"
-        / "gallon."
-        / "gallon"
-        / "gal."
-        / "gal"
-
-        calorie
-        = "calories"
-        / "calorie"
-        / "cal"
-        / "kilocalories"
-        / "kilocalorie"
-        / "kCal"
-        / "kcal"
-
-        ounce
-        = "ounces"
-        / "ounce(s)"
-        / "ounce."
-        / "ounce"
-        / "oz."
-        / "oz"
-
-        pint
-        = "pints"
-        / "pint(s)"
-        / "pint."
-        / "pint"
-        / "pt."
-        / "pt"
-
-        pound
-        = "pounds"
-        / "pound(s)"
-        / "pound."
-        / "pound"
-        / "lbs."
-        / "lbs"
-        / "lb."
-        / "lb"
-        / "#"
-
-        quart
-        = "quarts"
-        / "quart(s)"
-        / "quart."
-        / "quart"
-        / "qts."
-        / "qts"
-        / "qt."
-        / "qt"
-
-        tablespoon
-        = "tablespoons"
-        / "tablespoon(s)"
-        / "tablespoon."
-        / "tablespoon"
-        / "tbspns."
-        / "tbspns"
-        / "Tbsp."
-        / "Tbsp"
-        / "tbsp."
-        / "tbsp"
-        / "TBS."
-        / "TBS"
-        / "Tbs."
-        / "Tbs"
-        / "tbs."
-        / "tbs"
-        / "T."
-        / "T"
-
-        teaspoon
-        = "teaspoons"
-        / "teaspoon(s)"
-        / "teaspoon"
-        / "teasps."
-        / "teasps"
-        / "teasp."
-        / "teasp"
-        / "tsp."
-        / "tsp"
-        / "t."
-        / "t"
-
-        metric_unit
-        = gram
-        / joule
-        / kilogram
-        / kilojoule
-        / liter
-        / milligram
-        / milliliter
-
-        gram
-        = "grams"
-        / "gram(s)"
-        / "gram"
-        / "gr."
-        / "gr"
-        / "G."
-        / "G"
-        / "g."
-        / "g"
-
-        joule
-        = "joules"
-        / "joule(s)"
-        / "joule"
-        / "j"
-
-        kilogram
-        = "kilograms"
-        / "kilogram(s)"
-        / "kilogram"
-        / "KG."
-        / "KG"
-        / "Kg."
-        / "Kg"
-        / "kg."
-        / "kg"
-
-        kilojoule
-        = "kilojoules"
-        / "kilojoule(s)"
-        / "kilojoule"
-        / "kJ"
-        / "kj"
-
-        liter
-        = "liters"
-        / "liter(s)"
-        / "liter"
-        / "L."
-        / "L"
-        / "l."
-        / "l"
-
-        milligram
-        = "milligrams"
-        / "milligram(s)"
-        / "milligram"
-        / "mgs."
-        / "mgs"
-        / "mg."
-        / "mg"
-
-        milliliter
-        = "milliliters"
-        / "milliliter(s)"
-        / "milliliter"
-        / "mls."
-        / "mls"
-        / "ml."
-        / "ml"
-
-        imprecise_unit
-        = dash
-        / handful
-        / pinch
-        / touch
-        / stick
-        / punnet
-        / head
-        
-        head
-        = "heads"
-        / "head"
+        # unit and imprecise_unit are single-pass lookups over unit_aliases,
+        # see _UnitExpression, and written_number is a word-level lookup over
+        # number_value, see _WrittenNumberExpression.
 
         # abbreviated_unit
         # = letter letter letter?
 
-        dash
-        = "dashes"
-        / "dash"
-
-        handful
-        = "handfuls"
-        / "handful"
-
-        pinch
-        = "pinches"
-        / "pinch"
-
-        touch
-        = "touches"
-        / "touch"
-
-        stick
-        = "sticks"
-        / "stick(s)"
-        / "stick"
-
-        punnet
-        = "punnetts"
-        / "punnett"
-        / "punnets"
-        / "punnet"
-
         number = written_number break
 
-        written_number
-        = "a"
-        / "an"
-        / "zero"
-        / "one"
-        / "two"
-        / "three"
-        / "four"
-        / "five"
-        / "six"
-        / "seven"
-        / "eight"
-        / "nine"
-        / "ten"
-        / "eleven"
-        / "twelve"
-        / "thirteen"
-        / "fourteen"
-        / "fifteen"
-        / "sixteen"
-        / "seventeen"
-        / "eighteen"
-        / "nineteen"
-        / "twenty"
-        / "thirty"
-        / "forty"
-        / "fifty"
-        / "sixty"
-        / "seventy"
-        / "eighty"
-        / "ninety"
-
         unicode_fraction
         = ~"[¼]"u
         / ~"[½]"u
@@ -463,7 +1169,574 @@ class Ingreedy(NodeVisitor):
 
         catch_all
         = ~".*"
-        """)
+        """,
+        unit=_UnitExpression(unit_aliases, name='unit'),
+        written_number=_WrittenNumberExpression(
+            number_value, number_multiplier, name='written_number'),
+        imprecise_unit=_UnitExpression(
+            {'imprecise': unit_aliases['imprecise']}, name='imprecise_unit'))
+
+    def __init__(self, cache_size=None, fast_path=True, compact=False,
+                 profile=None, direct=False, fields=None, memo_rules=None,
+                 memo_limit=None, max_length=None, max_steps=None,
+                 timeout=None, normalize=False, locale='en'):
+        if locale != 'en':
+            if locale not in locales:
+                raise ValueError('locale must be one of %s, not %r' % (
+                    sorted(['en'] + list(locales)), locale))
+            self.grammar = _locale_grammar(type(self), locale)
+        self.locale = locale
+        self._locale_parsers = {}
+        self._units_version = _units_version
+        self._visit_methods = {}
+        self._evaluator = None
+        self._memoized = None
+        self.memo_rules = None if memo_rules is None else frozenset(memo_rules)
+        self.memo_limit = memo_limit
+        self.max_length = max_length
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.normalize = normalize
+        self.profile = profile
+        self.fast_path = fast_path
+        self.direct = direct
+        self.fields = _all_fields if fields is None else frozenset(fields)
+        if not self.fields or not self.fields <= _all_fields:
+            raise ValueError('fields must be a subset of %s, not %r' % (
+                sorted(_all_fields), fields))
+        self.compact = compact
+        self._build_result = _compact_result if compact else _dict_result
+        self.cache_size = cache_size
+        self._cache = OrderedDict() if cache_size else None
+        self._lock = threading.Lock()
+        self._cache_hits = self._cache_misses = self._cache_evictions = 0
+
+    def parse(self, text, pos=0, locale=None):
+        """Parse ``text`` and return its quantities and ingredient.
+
+        Simple lines such as "2 cups flour" are matched by a precompiled
+        regex fast path that gives the same result as the grammar; anything
+        else falls through to the full grammar. Pass ``fast_path=False`` to
+        always use the grammar. Subclasses that override a visit_* method
+        or ``generic_visit()`` always use the grammar too.
+
+        When the parser was created with a ``cache_size``, results for full
+        lines are memoized with LRU eviction. Every call returns a fresh
+        copy, so mutating a result never alters what is cached.
+
+        Pass a ``ParseProfile`` as ``profile`` to count what each grammar
+        rule and visit_* method does; it adds no cost when left out.
+
+        With ``compact=True`` results are immutable ``ParseResult`` and
+        ``Quantity`` named tuples rather than dicts (and cached ones are
+        shared rather than copied); ``to_dict()`` turns them back into the
+        usual shape.
+
+        With ``direct=True`` the visit_* methods run while the grammar is
+        matched, so no parse tree is built and walked afterwards. Results
+        are the same; the nodes those methods get have no children. The
+        fast path and direct evaluation need the unit and written number
+        lookups of ``Ingreedy.grammar``; a subclass with a ``Grammar`` of
+        its own that spells out a rule per unit always gets the tree parse.
+
+        ``fields`` picks which of 'quantity' and 'ingredient' to compute;
+        the other is None in results. A quantity-only parse stops after the
+        leading quantities, so it doesn't fail on what follows them. An
+        ingredient-only parse skips the numeric conversions.
+
+        The packrat memo keeps every rule's result at every position it was
+        tried. ``memo_rules`` limits that to the named rules given, such as
+        ``selective_memo_rules``, and ``memo_limit`` caps the entries one
+        parse keeps; anything else is matched again when it's needed.
+
+        ``max_length``, ``max_steps`` and ``timeout`` (in seconds) bound the
+        work done on any one line: a line longer than ``max_length``, or
+        whose parse takes more than ``max_steps`` packrat lookups or runs
+        past ``timeout``, raises ``ParseBudgetExceeded``, which
+        ``parse_many()`` and friends turn into a ``ParseFailure``.
+
+        With ``normalize=True`` lines go through ``normalize()`` first, so
+        non-breaking spaces, en-dashes, full-width digits and the like parse
+        as their ASCII counterparts; results then hold the normalized text,
+        while error positions still point into the original line.
+
+        ``locale`` picks the units and number words of another language from
+        ``locales``, such as 'cs'; pass it here for one line, or to the
+        constructor for every line. English ('en') is the default.
+
+        A parser keeps no per-parse state on itself, so one instance can be
+        shared by any number of threads; its result cache is locked. Only
+        a ``profile`` may lose counts when updated from several threads.
+        """
+        if locale is not None and locale != self.locale:
+            return self._locale_parser(locale).parse(text, pos)
+        if pos:
+            return super(Ingreedy, self).parse(text, pos)
+        cache = self._cache
+        if cache is None:
+            return self._parse_line(text)
+        with self._lock:
+            if self._units_version != _units_version:
+                cache.clear()  # register_unit() may change any result
+                self._units_version = _units_version
+            result = cache.get(text)
+            if result is not None:
+                self._cache_hits += 1
+                cache.move_to_end(text)
+                return _copy_result(result)
+            self._cache_misses += 1
+        result = self._parse_line(text)
+        with self._lock:
+            cache[text] = _copy_result(result)
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+                self._cache_evictions += 1
+        return result
+
+    def _locale_parser(self, locale):
+        # A parser like this one for another locale, kept for reuse.
+        parser = self._locale_parsers.get(locale)
+        if parser is None:
+            parser = type(self)(**dict(self._options(), locale=locale))
+            parser.profile = self.profile
+            parser = self._locale_parsers.setdefault(locale, parser)
+        return parser
+
+    def _parse_line(self, text):
+        if self.max_length is not None and len(text) > self.max_length:
+            raise ParseBudgetExceeded(text, 'max_length', self.max_length)
+        if self.normalize:
+            normalized = normalize(text)
+            if normalized != text:
+                try:
+                    return self._parse_normalized(normalized)
+                except ParseError as e:
+                    # Point the error at the original line.
+                    if e.pos is not None and e.pos >= 0:
+                        e.pos = normalized_offsets(text)[e.pos]
+                    e.text = text
+                    raise
+        return self._parse_normalized(text)
+
+    def _parse_normalized(self, text):
+        profile = self.profile
+        fast_path = _fast_path(self.grammar)
+        if self.fast_path and fast_path is not None and \
+                _visits_like_ingreedy(type(self)):
+            parsed = fast_path.parse(text)
+            if profile is not None:
+                counts = profile.rules.setdefault('<fast path>', [0, 0, 0])
+                counts[0] += 1
+                counts[1 if parsed is not None else 2] += 1
+            if parsed is not None:
+                return self._selected_result(*parsed)
+        if self.direct and fast_path is not None:
+            try:
+                return self._evaluate(text)
+            except ParseBudgetExceeded:
+                raise
+            except Exception:
+                pass  # let the tree parse below raise the usual error
+        cache = self._new_cache(text)
+        fields = self.fields
+        if fields == _quantity_only:
+            node = self._match(text, cache, self.grammar['multipart_quantity'])
+            return self._build_result(self.visit(node), None)
+        node = self._match(text, cache)
+        if fields == _ingredient_only:
+            # ingredient_addition's fourth member is "ingredient?"
+            return self._build_result(None, self.visit(node.children[3]))
+        return self.visit(node)
+
+    def _new_cache(self, text=''):
+        # A packrat cache for parsing text, following the memo policy and
+        # enforcing the step and time budget.
+        profile = self.profile
+        budgeted = self.max_steps is not None or self.timeout is not None
+        if profile is None and self.memo_rules is None and \
+                self.memo_limit is None and not budgeted:
+            return defaultdict(dict)
+        memoized = self._memoized
+        if memoized is None and self.memo_rules is not None:
+            memoized = self._memoized = frozenset(
+                id(expression) for expression in _expressions(self.grammar)
+                if expression.name in self.memo_rules)
+        if profile is not None:
+            cache = profile._cache(
+                self.grammar, memoized, self.memo_limit,
+                _ProfilingBudgetCache if budgeted else None)
+        elif budgeted:
+            cache = _BudgetCache(memoized, self.memo_limit)
+        else:
+            return _PolicyCache(memoized, self.memo_limit)
+        if budgeted:
+            self._start_budget(cache, text)
+        return cache
+
+    def _start_budget(self, cache, text):
+        # Set a budget-enforcing cache up for a parse of text.
+        cache.text = text
+        cache.steps = 0
+        if self.max_steps is not None:
+            cache.max_steps = self.max_steps
+        if self.timeout is not None:
+            cache.timeout = self.timeout
+            cache.deadline = time.perf_counter() + self.timeout
+
+    def _selected_result(self, quantities, ingredient):
+        fields = self.fields
+        return self._build_result(
+            quantities if 'quantity' in fields else None,
+            ingredient if 'ingredient' in fields else None)
+
+    def _evaluate(self, text):
+        profile = self.profile
+        evaluator = self._evaluator
+        cache = self._new_cache(text)
+        budgeted = isinstance(cache, _BudgetCache)
+        if evaluator is None or evaluator.budgeted != budgeted:
+            if profile is None:
+                evaluator = _shared_evaluator(
+                    self.grammar, type(self), self.fields,
+                    memoized=self._memoized, budgeted=budgeted)
+            else:
+                evaluator = _Evaluator(
+                    self.grammar, self._timed_actions(),
+                    _evaluated_rule(self.grammar, self.fields),
+                    memoized=self._memoized, budgeted=budgeted)
+            self._evaluator = evaluator
+        value = evaluator.evaluate(text, cache, self)
+        if self.fields == _quantity_only:
+            return self._build_result(value, None)
+        return value
+
+    def _timed_actions(self):
+        actions = {}
+        for name, action in _actions(
+                self.grammar, type(self), self.fields).items():
+            timed = self.profile._timed(
+                action.__name__, action.__get__(self, type(self)))
+            actions[name] = (lambda visitor, node, visited_children,
+                             timed=timed: timed(node, visited_children))
+        return actions
+
+    def _match(self, text, cache, prefix_rule=None):
+        # Expression.parse() for the default rule, with our own packrat
+        # cache, or Expression.match() for prefix_rule.
+        rule = prefix_rule or self.grammar.default_rule
+        error = ParseError(text)
+        node = rule.match_core(text, 0, cache, error)
+        if node is None:
+            raise error
+        if node.end < len(text) and prefix_rule is None:
+            raise IncompleteParseError(text, node.end, rule)
+        return node
+
+    def cache_info(self):
+        """Return hit, miss and eviction counters for the result cache."""
+        with self._lock:
+            return CacheInfo(
+                self._cache_hits, self._cache_misses, self._cache_evictions,
+                self.cache_size,
+                len(self._cache) if self._cache is not None else 0)
+
+    def cache_clear(self):
+        """Empty the result cache and reset its counters."""
+        with self._lock:
+            if self._cache is not None:
+                self._cache.clear()
+            self._cache_hits = self._cache_misses = 0
+            self._cache_evictions = 0
+
+    def visit(self, node):
+        # Same contract as NodeVisitor.visit(), but the visit_* lookup is
+        # memoized per rule name, so a long-lived instance pays for it once.
+        name = node.expr.name
+        method = self._visit_methods.get(name)
+        if method is None:
+            method = getattr(self, 'visit_' + name, self.generic_visit)
+            if self.profile is not None:
+                method = self.profile._timed(
+                    getattr(method, '__name__', name), method)
+            self._visit_methods[name] = method
+        try:
+            return method(node, [self.visit(n) for n in node.children])
+        except (VisitationError, UndefinedLabel):
+            raise
+        except Exception as exc:
+            if isinstance(exc, self.unwrapped_exceptions):
+                raise
+            raise VisitationError(exc, type(exc), node) from exc
+
+    def parse_many(self, lines, workers=None, chunk_size=1000, ordered=True,
+                   threads=False):
+        """Parse an iterable of lines, yielding one result per line.
+
+        Trailing newlines are stripped, so an open file can be passed in
+        directly. Lines that fail to parse yield a ``ParseFailure`` record
+        instead of raising, so one bad line doesn't abort the batch.
+
+        With ``workers`` set, lines are sent in chunks of ``chunk_size`` to a
+        pool of that many processes, each holding its own parser. Only a few
+        chunks per worker are in flight at once, so memory stays bounded for
+        arbitrarily long inputs. With ``ordered=False`` results are yielded
+        as ``(index, result)`` pairs in completion order instead.
+
+        With ``threads=True`` the chunks go to a pool of ``workers`` threads
+        that all share this parser instead, which saves starting processes
+        and pickling lines and results. That scales across cores on a
+        free-threaded CPython build; with the GIL it only helps when lines
+        are produced or results consumed with I/O in between.
+        """
+        if not workers:
+            results = self._parse_lines(lines)
+            return results if ordered else enumerate(results)
+        return self._parse_pooled(lines, workers, chunk_size, ordered,
+                                  threads)
+
+    def parse_unique(self, lines, stats=None, max_distinct=100000,
+                     tmp_dir=None):
+        """Like ``parse_many()``, but each distinct line is parsed once and
+        its result handed out at every position the line appears at.
+
+        Results for up to ``max_distinct`` distinct lines are kept in
+        memory. When the input has more, the rest of it is deduplicated by
+        an external sort instead: (line, position) pairs are sorted in runs
+        of ``max_distinct`` that are spilled to temporary files in
+        ``tmp_dir``, merged so equal lines meet, parsed, and merged back
+        into input order. Pass a ``DedupStats`` as ``stats`` to see how many
+        lines were parsed.
+        """
+        if stats is None:
+            stats = DedupStats()
+        results = {}
+        lines = enumerate(lines)
+        for index, line in lines:
+            line = line.rstrip('\r\n')
+            result = results.get(line)
+            if result is None:
+                if len(results) >= max_distinct:
+                    rest = chain([(index, line)], (
+                        (index, line.rstrip('\r\n'))
+                        for index, line in lines))
+                    for result in self._parse_sorted(
+                            rest, results, stats, max_distinct, tmp_dir):
+                        yield result
+                    return
+                stats.distinct += 1
+                result = results[line] = next(self._parse_lines([line]))
+            stats.lines += 1
+            yield _fan_out(result, index)
+
+    def _parse_sorted(self, lines, results, stats, run_size, tmp_dir):
+        def by_line():
+            for index, line in lines:
+                stats.lines += 1
+                stats.spilled += 1
+                yield line, index
+
+        def parsed():
+            runs = _sorted_runs(by_line(), run_size, tmp_dir)
+            for line, group in groupby(heapq.merge(*runs), itemgetter(0)):
+                result = results.get(line)
+                if result is None:
+                    stats.distinct += 1
+                    result = next(self._parse_lines([line]))
+                for _, index in group:
+                    yield index, result
+
+        runs = _sorted_runs(parsed(), run_size, tmp_dir, itemgetter(0))
+        for index, result in heapq.merge(*runs, key=itemgetter(0)):
+            yield _fan_out(result, index)
+
+    def parse_columns(self, lines):
+        """Parse an iterable of lines straight into a ``Columns``.
+
+        Lines are handled as in ``parse_many()``, but each result is
+        appended to the column buffers as it is parsed, without building a
+        dict or tuple for it.
+        """
+        columns = Columns()
+        amounts, units, types = columns.amount, columns.unit, columns.unit_type
+        data = columns.ingredient_data
+        unit_codes = dict((unit, code) for code, unit in enumerate(unit_names))
+        unit_codes[None] = -1
+        type_codes = dict((name, code) for code, name in enumerate(unit_types))
+        type_codes[None] = -1
+
+        parser = type(self)(**dict(self._options(), cache_size=None))
+        parser._build_result = _raw_result
+        for result in parser._parse_lines(lines):
+            if isinstance(result, ParseFailure):
+                columns.failures.append(result)
+                quantities = ingredient = None
+            else:
+                quantities, ingredient = result
+            for unit, unit_type, amount in quantities or ():
+                amounts.append(amount)
+                units.append(unit_codes.get(unit, -1))
+                types.append(type_codes.get(unit_type, -1))
+            if ingredient is not None:
+                data += ingredient.encode('utf-8')
+            columns.quantity_offsets.append(len(amounts))
+            columns.ingredient_offsets.append(len(data))
+            columns.ingredient_valid.append(ingredient is not None)
+            columns.valid.append(not isinstance(result, ParseFailure))
+        return columns
+
+    def _parse_lines(self, lines, start=0):
+        parse = self.parse
+        for index, line in enumerate(lines, start):
+            line = line.rstrip('\r\n')
+            try:
+                yield parse(line)
+            except ParseError as e:
+                yield ParseFailure(index, line, e.pos, str(e))
+            except VisitationError as e:
+                cause = e.__cause__
+                error = str(e) if cause is None else '%s: %s' % (
+                    type(cause).__name__, cause)
+                yield ParseFailure(index, line, None, error)
+
+    def _options(self):
+        # Constructor arguments needed to rebuild an equivalent parser in a
+        # worker process.
+        return {'cache_size': self.cache_size, 'fast_path': self.fast_path,
+                'compact': self.compact, 'direct': self.direct,
+                'fields': self.fields, 'memo_rules': self.memo_rules,
+                'memo_limit': self.memo_limit, 'max_length': self.max_length,
+                'max_steps': self.max_steps, 'timeout': self.timeout,
+                'normalize': self.normalize, 'locale': self.locale}
+
+    def _parse_pooled(self, lines, workers, chunk_size, ordered,
+                      threads=False):
+        chunks = ((chunk,) for chunk in _chunked(lines, chunk_size))
+        function = self._parse_chunk if threads else _parse_chunk
+        for start, results in self._pooled(
+                function, chunks, workers, ordered, threads):
+            if ordered:
+                for result in results:
+                    yield result
+            else:
+                for item in enumerate(results, start):
+                    yield item
+
+    def _parse_chunk(self, chunk):
+        start, lines = chunk
+        return start, list(self._parse_lines(lines, start))
+
+    def _pooled(self, function, jobs, workers, ordered=True, threads=False):
+        # Yields function(*job) for each job, computed in a pool of worker
+        # processes that each hold a parser like this one, or of threads
+        # sharing this one. Only two jobs per worker are in flight at once.
+        from concurrent.futures import (
+            FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait)
+
+        jobs = iter(jobs)
+        if threads:
+            pool = ThreadPoolExecutor(workers)
+        else:
+            pool = ProcessPoolExecutor(
+                workers, initializer=_init_worker,
+                initargs=(type(self), self._options(),
+                          tuple(_registered_units)))
+        with pool:
+            pending = deque(pool.submit(function, *job)
+                            for job in islice(jobs, workers * 2))
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [f for f in pending if f in finished]
+                    for future in done:
+                        pending.remove(future)
+                for future in done:
+                    for job in islice(jobs, 1):
+                        pending.append(pool.submit(function, *job))
+                    yield future.result()
+
+    def parse_file(self, path, workers=None, encoding='utf-8',
+                   errors='strict', chunk_bytes=1 << 20):
+        """Parse every line of the file at ``path``, like ``parse_many()``.
+
+        The file is memory-mapped rather than read, and each line is decoded
+        only when its turn comes, so memory use stays flat however big the
+        file is. Lines end at ``\n``, so ``encoding`` must be ASCII
+        compatible (UTF-8, Latin-1, ...).
+
+        With ``workers`` set, the file is cut at line ends into byte ranges
+        of about ``chunk_bytes``, and each worker process maps the file
+        itself and parses the ranges it is given; no lines are pickled.
+        Results are yielded in file order.
+        """
+        if not workers:
+            return self._parse_lines(
+                _mapped_lines(path, encoding, errors, 0, None))
+        return self._parse_file_pooled(
+            path, workers, encoding, errors, chunk_bytes)
+
+    def _parse_file_pooled(self, path, workers, encoding, errors,
+                           chunk_bytes):
+        jobs = ((path, start, end, encoding, errors)
+                for start, end in _byte_ranges(path, chunk_bytes))
+        index = 0
+        for results in self._pooled(_parse_range, jobs, workers):
+            for result in results:
+                if isinstance(result, ParseFailure):
+                    # Workers count lines from the start of their range.
+                    result = result._replace(index=result.index + index)
+                yield result
+            index += len(results)
+
+    async def parse_async(self, text, executor=None):
+        """Coroutine version of ``parse()``.
+
+        The parse runs in ``executor``, a thread or process pool (the event
+        loop's default thread pool if None), so a long line doesn't block
+        the event loop. Each worker thread or process keeps its own parser
+        built with this one's options.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            executor, _parse_text, type(self), self._options(),
+            tuple(_registered_units), text)
+        if isinstance(result, _Raised):
+            raise result.error
+        return result
+
+    async def parse_many_async(self, lines, executor=None, chunk_size=100,
+                               max_in_flight=4):
+        """Async generator version of ``parse_many()``.
+
+        ``lines`` can be an iterable or an async iterable. Lines are sent to
+        ``executor`` in chunks of ``chunk_size``; once ``max_in_flight``
+        chunks are pending, no more lines are read until the oldest one is
+        done. Results come out in input order, with ``ParseFailure`` records
+        for lines that fail.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        cls, options = type(self), self._options()
+        registrations = tuple(_registered_units)
+        pending = deque()
+        try:
+            async for start, chunk in _chunked_async(lines, chunk_size):
+                pending.append(loop.run_in_executor(
+                    executor, _parse_chunk_with, cls, options,
+                    registrations, start, chunk))
+                if len(pending) >= max_in_flight:
+                    for result in await pending.popleft():
+                        yield result
+            while pending:
+                for result in await pending.popleft():
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
 
     def visit_ingredient(self, node, visited_children):
         text = node.text
@@ -472,6 +1745,8 @@ class Ingreedy(NodeVisitor):
         return text
 
     def visit_imprecise_unit(self, node, visited_children):
+        if isinstance(node, UnitNode):
+            return node.unit
         return node.children[0].expr_name, 'imprecise'
 
     def visit_metric_unit(self, node, visited_children):
@@ -505,14 +1780,10 @@ class Ingreedy(NodeVisitor):
         results = []
         for child in visited_children:
             unit, system, amount = child
-            if results and not results[0]['unit']:
-                amount *= results[0]['amount']
+            if results and not results[0][0]:
+                amount *= results[0][2]
                 results = []
-            results.append({
-                'unit': unit,
-                'unit_type': system,
-                'amount': amount
-            })
+            results.append((unit, system, amount))
         return results
 
     def visit_quantity_fragment(self, node, visited_children):
@@ -544,7 +1815,10 @@ class Ingreedy(NodeVisitor):
         return unit, system, 1
 
     def visit_unit(self, node, visited_children):
-        unit, system = visited_children[0]
+        if isinstance(node, UnitNode):
+            unit, system = node.unit
+        else:
+            unit, system = visited_children[0]
         return unit, system, 1
 
     def visit_parenthesized_quantity(self, node, visited_children):
@@ -552,16 +1826,905 @@ class Ingreedy(NodeVisitor):
         return unit, system, amount
 
     def visit_ingredient_addition(self, node, visited_children):
-        return {
-            'quantity': visited_children[0],
-            'ingredient': visited_children[3]
-        }
+        return self._build_result(visited_children[0], visited_children[3])
 
     def visit_number(self, node, visited_children):
         return visited_children[0]
 
     def visit_written_number(self, node, visited_children):
+        if isinstance(node, NumberNode):
+            return node.value
         return number_value[node.text]
 
     def generic_visit(self, node, visited_children):
         return visited_children[0] if visited_children else None
+
+
+# Process pool plumbing for Ingreedy.parse_many(workers=...). Each worker
+# builds a single parser when it starts and reuses it for every chunk.
+_worker_parser = None
+
+
+def _init_worker(cls, options, registrations):
+    global _worker_parser
+    _replay_units(registrations)
+    _worker_parser = cls(**options)
+
+
+def _parse_chunk(chunk):
+    start, lines = chunk
+    return start, list(_worker_parser._parse_lines(lines, start))
+
+
+def _parse_range(path, start, end, encoding, errors):
+    return list(_worker_parser._parse_lines(
+        _mapped_lines(path, encoding, errors, start, end)))
+
+
+def _mapped_lines(path, encoding, errors, start, end):
+    # Decoded lines of path[start:end], split on b'\n' in a memory map; the
+    # memoryview slices are decoded straight from the mapping.
+    import mmap
+
+    with open(path, 'rb') as fh:
+        if not os.fstat(fh.fileno()).st_size:
+            return  # empty files can't be mapped
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                end = len(mapped) if end is None else end
+                find = mapped.find
+                while start < end:
+                    newline = find(b'\n', start, end)
+                    if newline < 0:
+                        newline = end
+                    yield str(view[start:newline], encoding, errors)
+                    start = newline + 1
+            finally:
+                view.release()
+
+
+def _byte_ranges(path, size):
+    # (start, end) offsets that cut the file into pieces of about ``size``
+    # bytes, each ending just after a newline or at the end of the file.
+    import mmap
+
+    with open(path, 'rb') as fh:
+        total = os.fstat(fh.fileno()).st_size
+        if not total:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < total:
+                newline = mapped.find(b'\n', min(start + size, total) - 1)
+                end = total if newline < 0 else newline + 1
+                yield start, end
+                start = end
+
+
+# Parsers for parse_async() and parse_many_async() jobs: one per thread (or
+# process) and parser configuration, so jobs never share a parser's state.
+_local = threading.local()
+
+
+def _local_parser(cls, options, registrations):
+    _replay_units(registrations)
+    parsers = getattr(_local, 'parsers', None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    key = cls, tuple(sorted(options.items()))
+    parser = parsers.get(key)
+    if parser is None:
+        parser = parsers[key] = cls(**options)
+    return parser
+
+
+def _parse_text(cls, options, registrations, text):
+    try:
+        return _local_parser(cls, options, registrations).parse(text)
+    except (ParseError, VisitationError) as e:
+        return _Raised(e)
+
+
+class _Raised(object):
+    # An error from a parse_async() job, handed back for the coroutine to
+    # raise. Pickled back from a worker process, a VisitationError (which
+    # can't be pickled) becomes a _PickledVisitationError.
+    __slots__ = ['error']
+
+    def __init__(self, error):
+        self.error = error
+
+    def __reduce__(self):
+        error = self.error
+        if isinstance(error, VisitationError) and \
+                not isinstance(error, _PickledVisitationError):
+            error = _PickledVisitationError(str(error), error.original_class)
+        return _Raised, (error,)
+
+
+class _PickledVisitationError(VisitationError):
+    # A VisitationError's message and original_class, without the node.
+    def __init__(self, message, original_class=None):
+        Exception.__init__(self, message)
+        self.original_class = original_class
+
+
+def _parse_chunk_with(cls, options, registrations, start, lines):
+    return list(_local_parser(cls, options, registrations)._parse_lines(
+        lines, start))
+
+
+class _FastPath(object):
+    """Regex matcher for "<amount> [<unit>] <ingredient>" lines.
+
+    Units and written numbers are recognized with the grammar's own
+    lookups, so the fast path picks the same alternative the PEG would.
+    ``parse()`` returns None for anything it can't vouch for.
+    """
+
+    # float / mixed_number / fraction / integer, tried in the grammar's order
+    amount = re.compile(
+        r'(?:([0-9]*[.][0-9]+)|([0-9]+)[ -]([0-9]+)[/⁄]([0-9]+)'
+        r'|([0-9]+)[/⁄]([0-9]+)|([0-9]+)) ?')
+    breaks = frozenset(' ,-\t')
+
+    def __init__(self, grammar):
+        # The characters up to the end of Latin Extended-B that the
+        # grammar's letter rule matches.
+        letter = grammar['letter'].re
+        self.letters = frozenset(
+            char for char in map(chr, range(0x250)) if letter.match(char))
+        self.unit = grammar['unit']
+        self.imprecise_unit = grammar['imprecise_unit']
+        self.written_number = grammar['written_number']
+
+    def parse(self, text):
+        m = self.amount.match(text)
+        if m is None or '\n' in text:
+            return None
+        pos = m.end()
+        if not self._letter_at(text, pos):
+            return None
+        float_, whole, numerator, denominator, fraction_numerator, \
+            fraction_denominator, integer = m.groups()
+        if float_ is not None:
+            amount = float(float_)
+        elif integer is not None:
+            amount = int(integer)
+        elif whole is not None:
+            if not int(denominator):
+                return None
+            amount = float(int(whole)) + round(
+                float(int(numerator)) / float(int(denominator)), 3)
+        else:
+            if not int(fraction_denominator):
+                return None
+            amount = round(float(int(fraction_numerator)) /
+                           float(int(fraction_denominator)), 3)
+
+        unit = unit_type = None
+        found = self.unit.match_unit(text, pos)
+        if found is not None and not self._letter_at(text, found[0]):
+            end, (unit, unit_type) = found
+            if text[end:end + 1] != ' ' or not self._letter_at(text, end + 1):
+                return None
+            pos = end + 1
+        if self._starts_quantity(text, pos):
+            return None
+
+        ingredient = text[pos:]
+        if ingredient.startswith('of '):
+            ingredient = ingredient[3:]
+        return [(unit, unit_type, amount)], ingredient
+
+    def _starts_quantity(self, text, pos):
+        # Whether another quantity_fragment would match at the start of the
+        # ingredient: a written number followed by a break, or an imprecise
+        # unit not followed by a letter.
+        found = self.written_number.match_number(text, pos)
+        if found is not None and text[found[0]:found[0] + 1] in self.breaks:
+            return True
+        found = self.imprecise_unit.match_unit(text, pos)
+        return found is not None and not self._letter_at(text, found[0])
+
+    def _letter_at(self, text, pos):
+        return text[pos:pos + 1] in self.letters
+
+
+# (grammar, its _FastPath or None) by id(grammar); holding the grammar keeps
+# its id from being reused by another one.
+_fast_paths = {}
+
+
+def _fast_path(grammar):
+    # The fast path for grammar, or None when grammar doesn't use this
+    # module's unit and written number lookups, as a subclass's own
+    # Grammar(...) with a rule per unit doesn't.
+    entry = _fast_paths.get(id(grammar))
+    if entry is None:
+        fast_path = _FastPath(grammar) if _has_lookups(grammar) else None
+        entry = _fast_paths[id(grammar)] = grammar, fast_path
+    return entry[1]
+
+
+def _has_lookups(grammar):
+    return isinstance(grammar.get('unit'), _UnitExpression) and \
+        isinstance(grammar.get('imprecise_unit'), _UnitExpression) and \
+        isinstance(grammar.get('written_number'), _WrittenNumberExpression)
+
+
+_plain_visitors = {}
+
+
+def _visits_like_ingreedy(cls):
+    # Whether cls keeps every visit_* method and generic_visit() of
+    # Ingreedy, so the fast path, which calls none of them, gives its
+    # results. Worked out once per class.
+    plain = _plain_visitors.get(cls)
+    if plain is None:
+        plain = _plain_visitors[cls] = all(
+            getattr(cls, name) is getattr(Ingreedy, name, None)
+            for name in dir(cls)
+            if name.startswith('visit_') or name == 'generic_visit')
+    return plain
+
+
+class _Evaluator(object):
+    """Matches a grammar and runs the visit_* methods in the same pass.
+
+    Every expression is compiled into a closure ``match(text, pos, cache,
+    visitor)`` that returns None, or ``(end, value)`` where value is what
+    visiting its node would return, so no Node tree is built or walked.
+    Rules without a visit_* method of their own pass their first child's
+    value up, as ``Ingreedy.generic_visit()`` does, without a call. Named
+    rules (those with ids in ``memoized``, if given) are memoized in
+    ``cache`` by expression id like ``Expression.match_core()`` does, so
+    the same packrat caches work here.
+
+    With ``track_reach``, memo entries are ``(result, reach)`` pairs, reach
+    being the end of the text the match looked at, for ``ParseSession``;
+    ``cache`` must then be a ``_ReachCache``. With ``budgeted``, expressions
+    that aren't memoized call ``cache.step()`` on every attempt, so a
+    ``_BudgetCache`` counts them as the tree parse would.
+    """
+
+    def __init__(self, grammar, actions, prefix_rule=None, track_reach=False,
+                 memoized=None, budgeted=False):
+        self.grammar = grammar  # keeps id(grammar) in _evaluators unique
+        self.actions = actions
+        self.track_reach = track_reach
+        self.memoized = memoized
+        self.budgeted = budgeted
+        self.compiled = {}
+        self.rule = prefix_rule or grammar.default_rule
+        self.prefix = prefix_rule is not None
+        self.match = self._compile(self.rule)
+
+    def evaluate(self, text, cache, visitor):
+        """Return the value of the whole of ``text`` (or of the start of it,
+        given a ``prefix_rule``); raise ParseError if it doesn't match."""
+        result = self.match(text, 0, cache, visitor)
+        if result is None:
+            raise ParseError(text, 0, self.rule)
+        if result[0] < len(text) and not self.prefix:
+            raise IncompleteParseError(text, result[0], self.rule)
+        return result[1]
+
+    def _compile(self, expression):
+        key = id(expression)
+        match = self.compiled.get(key)
+        if match is None:
+            # Rules that refer back to themselves go through this stand-in
+            # until the real closure exists.
+            target = []
+            self.compiled[key] = (lambda text, pos, cache, visitor:
+                                  target[0](text, pos, cache, visitor))
+            match = self._build(expression)
+            if self.track_reach and not isinstance(expression, Compound):
+                match = _tracked(match, _leaf_reach(expression))
+            if expression.name and (self.memoized is None or
+                                    key in self.memoized):
+                match = (_reach_memoized if self.track_reach
+                         else _memoized)(key, match)
+            elif self.budgeted:
+                match = _budgeted(match)
+            target.append(match)
+            self.compiled[key] = match
+        return match
+
+    def _build(self, expression):
+        action = self.actions.get(expression.name)
+        if isinstance(expression, _UnitExpression):
+            return _unit_match(expression, action)
+        if isinstance(expression, _WrittenNumberExpression):
+            return _number_match(expression, action)
+        if isinstance(expression, Literal):
+            return _literal_match(expression, action)
+        if isinstance(expression, Regex):
+            return _regex_match(expression, action)
+        members = [self._compile(member)
+                   for member in getattr(expression, 'members', ())]
+        if isinstance(expression, Sequence):
+            return _sequence_match(expression, members, action)
+        if isinstance(expression, OneOf):
+            return _one_of_match(expression, members, action)
+        if isinstance(expression, Lookahead):
+            return _lookahead_match(expression, members[0], action)
+        if isinstance(expression, Quantifier):
+            return _quantifier_match(
+                expression, members[0], action, self.track_reach)
+        raise ValueError('Cannot evaluate %r directly' % expression)
+
+
+def _memoized(key, match, _missing=object()):
+    def memoized(text, pos, cache, visitor):
+        memo = cache[key]
+        result = memo.get(pos, _missing)
+        if result is _missing:
+            result = memo[pos] = match(text, pos, cache, visitor)
+        return result
+    return memoized
+
+
+def _budgeted(match):
+    def budgeted(text, pos, cache, visitor):
+        cache.step()
+        return match(text, pos, cache, visitor)
+    return budgeted
+
+
+def _reach_memoized(key, match):
+    # _memoized() that also works out how far each match looked: cache.reach
+    # is the furthest any leaf has looked since the enclosing rule started.
+    def memoized(text, pos, cache, visitor):
+        memo = cache[key]
+        entry = memo.get(pos)
+        if entry is not None:
+            if entry[1] > cache.reach:
+                cache.reach = entry[1]
+            return entry[0]
+        outer = cache.reach
+        cache.reach = pos
+        result = match(text, pos, cache, visitor)
+        reach = cache.reach
+        memo[pos] = result, reach
+        if outer > reach:
+            cache.reach = outer
+        return result
+    return memoized
+
+
+def _tracked(match, reach):
+    def tracked(text, pos, cache, visitor):
+        result = match(text, pos, cache, visitor)
+        end = reach(text, pos, result)
+        if end > cache.reach:
+            cache.reach = end
+        return result
+    return tracked
+
+
+# A regex atom (a character class, an escape or a plain character) and its
+# quantifier.
+_regex_atom = re.compile(
+    r'(\[\^?\]?(?:\\.|[^\]\\])*\]|\\.|[^\\()\[\]{}|^$*+?])([*+?]?)')
+
+
+def _leaf_reach(expression):
+    # reach(text, pos, result) for a leaf expression: the end of the text it
+    # looked at, where len(text) + 1 means it depended on where text ends.
+    def unknown(text, pos, result):
+        return len(text) + 1
+
+    if isinstance(expression, (_UnitExpression, _WrittenNumberExpression)):
+        return lambda text, pos, result: expression.reach(text, pos)
+    if isinstance(expression, Literal):
+        length = len(expression.literal)
+        return lambda text, pos, result: pos + length
+    if not isinstance(expression, Regex):
+        return unknown
+    pattern = expression.re.pattern
+    quantifiers = []
+    start = 0
+    while start < len(pattern):
+        m = _regex_atom.match(pattern, start)
+        if m is None or m.group(1) in ('\\A', '\\b', '\\B', '\\Z',
+                                       '\\z', '\\G'):
+            return unknown
+        quantifiers.append(m.group(2))
+        start = m.end()
+    if not set(quantifiers) & set('*+'):
+        width = len(quantifiers)  # at most a character per atom
+        return lambda text, pos, result: pos + width
+    if len(quantifiers) == 1:
+        # x+ or x*: it looks one character past what it matched.
+        return lambda text, pos, result: (
+            pos + 1 if result is None else result[0] + 1)
+    return unknown
+
+
+class _ReachCache(defaultdict):
+    # Packrat cache for an _Evaluator with track_reach.
+    def __init__(self):
+        defaultdict.__init__(self, dict)
+        self.reach = 0
+
+
+class _BudgetReachCache(_ReachCache):
+    # A _ReachCache that also enforces the budget, as _BudgetCache does.
+    max_steps = _BudgetCache.max_steps
+    deadline = _BudgetCache.deadline
+    timeout = _BudgetCache.timeout
+    __getitem__ = _BudgetCache.__getitem__
+    step = _BudgetCache.step
+
+
+def _unit_match(expression, action):
+    match_unit = expression.match_unit
+
+    def match(text, pos, cache, visitor):
+        found = match_unit(text, pos)
+        if found is None:
+            return None
+        end, unit = found
+        if action is None:
+            return end, None
+        node = UnitNode(expression, text, pos, end)
+        node.unit = unit
+        return end, action(visitor, node, [])
+    return match
+
+
+def _number_match(expression, action):
+    match_number = expression.match_number
+
+    def match(text, pos, cache, visitor):
+        found = match_number(text, pos)
+        if found is None:
+            return None
+        end, value = found
+        if action is None:
+            return end, None
+        node = NumberNode(expression, text, pos, end)
+        node.value = value
+        return end, action(visitor, node, [])
+    return match
+
+
+def _literal_match(expression, action):
+    literal = expression.literal
+    length = len(literal)
+
+    def match(text, pos, cache, visitor):
+        if not text.startswith(literal, pos):
+            return None
+        if action is None:
+            return pos + length, None
+        node = Node(expression, text, pos, pos + length)
+        return pos + length, action(visitor, node, [])
+    return match
+
+
+def _regex_match(expression, action):
+    pattern = expression.re
+
+    def match(text, pos, cache, visitor):
+        m = pattern.match(text, pos)
+        if m is None:
+            return None
+        if action is None:
+            return m.end(), None
+        node = RegexNode(expression, text, pos, m.end())
+        node.match = m
+        return m.end(), action(visitor, node, [])
+    return match
+
+
+def _sequence_match(expression, members, action):
+    if action is None:
+        first, rest = members[0], members[1:]
+
+        def match(text, pos, cache, visitor):
+            result = first(text, pos, cache, visitor)
+            if result is None:
+                return None
+            end = result[0]
+            for member in rest:
+                found = member(text, end, cache, visitor)
+                if found is None:
+                    return None
+                end = found[0]
+            return end, result[1]
+        return match
+
+    def match(text, pos, cache, visitor):
+        end = pos
+        children = []
+        for member in members:
+            found = member(text, end, cache, visitor)
+            if found is None:
+                return None
+            end, value = found
+            children.append(value)
+        return end, action(visitor, Node(expression, text, pos, end), children)
+    return match
+
+
+def _one_of_match(expression, members, action):
+    def match(text, pos, cache, visitor):
+        for member in members:
+            found = member(text, pos, cache, visitor)
+            if found is not None:
+                if action is None:
+                    return found
+                node = Node(expression, text, pos, found[0])
+                return found[0], action(visitor, node, [found[1]])
+        return None
+    return match
+
+
+def _lookahead_match(expression, member, action):
+    negative = expression.negativity
+
+    def match(text, pos, cache, visitor):
+        if (member(text, pos, cache, visitor) is None) != negative:
+            return None
+        if action is None:
+            return pos, None
+        return pos, action(visitor, Node(expression, text, pos, pos), [])
+    return match
+
+
+def _quantifier_match(expression, member, action, track_reach=False):
+    minimum, maximum = expression.min, expression.max
+
+    # Same loop as Quantifier._uncached_match().
+    def match(text, pos, cache, visitor):
+        end = pos
+        size = len(text)
+        children = []
+        while end < size and len(children) < maximum:
+            found = member(text, end, cache, visitor)
+            if found is None:
+                break
+            children.append(found[1])
+            if found[0] == end and len(children) >= minimum:
+                break
+            end = found[0]
+        if track_reach and end >= size and cache.reach <= size:
+            cache.reach = size + 1  # the loop stopped at the end of text
+        if len(children) < minimum:
+            return None
+        if action is None:
+            return end, children[0] if children else None
+        node = Node(expression, text, pos, end)
+        return end, action(visitor, node, children)
+    return match
+
+
+def _actions(grammar, cls, fields=None):
+    # The visit_* function for each rule name that has one; with a custom
+    # generic_visit() every other rule (even unnamed ones) gets that. For an
+    # ingredient-only parse, only the rules building that are kept.
+    generic = (None if cls.generic_visit is Ingreedy.generic_visit
+               else cls.generic_visit)
+    actions = {}
+    for expression in _expressions(grammar):
+        action = getattr(cls, 'visit_' + expression.name, generic)
+        if action is not None:
+            actions[expression.name] = action
+    if fields == _ingredient_only:
+        actions = dict((name, actions[name])
+                       for name in ['ingredient', 'ingredient_addition']
+                       if name in actions)
+    return actions
+
+
+def _evaluated_rule(grammar, fields):
+    # The rule a quantity-only parse stops after, None for the whole line.
+    return grammar['multipart_quantity'] if fields == _quantity_only else None
+
+
+_evaluators = {}
+
+
+def _shared_evaluator(grammar, cls, fields=None, track_reach=False,
+                      memoized=None, budgeted=False):
+    key = id(grammar), cls, fields, track_reach, memoized, budgeted
+    evaluator = _evaluators.get(key)
+    if evaluator is None:
+        evaluator = _evaluators[key] = _Evaluator(
+            grammar, _actions(grammar, cls, fields),
+            _evaluated_rule(grammar, fields), track_reach, memoized,
+            budgeted)
+    return evaluator
+
+
+def _dict_result(quantities, ingredient):
+    return {
+        'quantity': None if quantities is None else [{
+            'unit': unit,
+            'unit_type': unit_type,
+            'amount': amount
+        } for unit, unit_type, amount in quantities],
+        'ingredient': ingredient
+    }
+
+
+def _compact_result(quantities, ingredient, _new=tuple.__new__):
+    # tuple.__new__ skips the namedtuple constructors' argument handling.
+    return _new(ParseResult, (
+        None if quantities is None else
+        tuple([_new(Quantity, quantity) for quantity in quantities]),
+        ingredient))
+
+
+def _raw_result(quantities, ingredient):
+    return quantities, ingredient
+
+
+def _copy_result(result):
+    if isinstance(result, ParseResult):
+        return result  # immutable already
+    quantities = result['quantity']
+    return {
+        'quantity': None if quantities is None else [
+            dict(quantity) for quantity in quantities],
+        'ingredient': result['ingredient'],
+    }
+
+
+def _fan_out(result, index):
+    # The result of a deduplicated line for its copy at ``index``.
+    if isinstance(result, ParseFailure):
+        return result._replace(index=index)
+    return _copy_result(result)
+
+
+# How many sorted runs _sorted_runs() merges at a time.
+_merge_width = 16
+
+
+def _sorted_runs(items, size, tmp_dir, key=None):
+    # Sorts ``items`` in runs of ``size``, each pickled to a temporary file,
+    # and returns an iterator over each run for heapq.merge(). Every time
+    # _merge_width runs of a level pile up they are merged into one run of
+    # the next level, so few files are open at once however many runs
+    # there are.
+    items = iter(items)
+    levels = []
+    while True:
+        run = sorted(islice(items, size), key=key)
+        if not run:
+            return [_read_run(fh) for level in levels for fh in level]
+        fh = _write_run(run, tmp_dir)
+        for level in levels:
+            level.append(fh)
+            if len(level) < _merge_width:
+                break
+            fh = _write_run(heapq.merge(*map(_read_run, level), key=key),
+                            tmp_dir)
+            del level[:]
+        else:
+            levels.append([fh])
+
+
+def _write_run(items, tmp_dir):
+    import pickle
+    import tempfile
+
+    items = iter(items)
+    fh = tempfile.TemporaryFile(dir=tmp_dir)
+    while True:
+        block = list(islice(items, 1024))
+        if not block:
+            return fh
+        pickle.dump(block, fh, pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(fh):
+    import pickle
+
+    with fh:
+        fh.seek(0)
+        while True:
+            try:
+                block = pickle.load(fh)
+            except EOFError:
+                return
+            for item in block:
+                yield item
+
+
+def _chunked(lines, size):
+    lines = iter(lines)
+    start = 0
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+async def _chunked_async(lines, size):
+    if not hasattr(lines, '__aiter__'):
+        for chunk in _chunked(lines, size):
+            yield chunk
+        return
+    start = 0
+    chunk = []
+    async for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield start, chunk
+            start += size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+Conversion = namedtuple('Conversion', ['amount', 'unit', 'imprecise'])
+
+
+def convert_quantities(amounts, units, to='base'):
+    """Convert arrays of amounts and units in one vectorized pass.
+
+    ``units`` holds unit names (None for no unit) or their codes, indexes
+    into ``unit_names`` (-1, or any code out of range, for no unit). ``to``
+    is a unit system from ``conversion_targets`` ('base' is gram,
+    milliliter and calorie) or a single unit name. Returns a
+    ``Conversion`` of NumPy arrays: the float64 amounts in the target units,
+    the codes of those units, and whether each row's unit is imprecise
+    (pinch, handful, ...). Rows that can't be converted (an imprecise or
+    unknown unit, no unit, or another dimension than the target unit's) get
+    NaN and code -1.
+
+    Needs NumPy (``pip install ingreedypy[numpy]``).
+    """
+    numpy = _numpy()
+    factors, targets, imprecise = _conversion_table(numpy, to)
+    codes = _unit_codes(numpy, units)
+    amounts = numpy.asarray(amounts, dtype=numpy.float64)
+    return Conversion(amounts * factors[codes], targets[codes],
+                      imprecise[codes])
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            'NumPy is needed for this: pip install ingreedypy[numpy]')
+    return numpy
+
+
+_conversion_tables = {}
+
+
+def _conversion_table(numpy, to):
+    # Arrays indexed by unit code with one extra entry at the end, which
+    # code -1 picks: the factor to multiply amounts by, the target unit
+    # code and the imprecise flag.
+    key = to, unit_names
+    table = _conversion_tables.get(key)
+    if table is not None:
+        return table
+    if to in conversion_targets:
+        targets = conversion_targets[to]
+    elif to in unit_factors:
+        targets = {unit_factors[to][0]: to}
+    else:
+        raise ValueError('Cannot convert to %r' % (to,))
+    size = len(unit_names) + 1
+    factors = numpy.full(size, numpy.nan)
+    codes = numpy.full(size, -1, dtype=numpy.intp)
+    imprecise = numpy.zeros(size, dtype=bool)
+    for code, unit in enumerate(unit_names):
+        imprecise[code] = unit in unit_aliases['imprecise']
+        dimension, factor = unit_factors.get(unit, (None, None))
+        target = targets.get(dimension)
+        if target is not None:
+            factors[code] = factor / unit_factors[target][1]
+            codes[code] = unit_names.index(target)
+    table = _conversion_tables[key] = factors, codes, imprecise
+    return table
+
+
+def _unit_codes(numpy, units):
+    units = numpy.asarray(units)
+    if units.dtype.kind in 'iu':
+        # Codes out of range are unknown units, like unknown names.
+        codes = units.astype(numpy.intp)
+        codes[(codes < -1) | (codes >= len(unit_names))] = -1
+        return codes
+    index = dict((unit, code) for code, unit in enumerate(unit_names))
+    return numpy.fromiter((index.get(unit, -1) for unit in units.flat),
+                          numpy.intp, units.size).reshape(units.shape)
+
+
+def main(argv=None):
+    """Entry point of the ``ingreedypy`` command.
+
+    Reads ingredient lines from files (or standard input) and writes one
+    JSON object per line, in input order. Lines that fail to parse are
+    written as ``null`` so output lines stay aligned with input lines, and
+    their ``ParseFailure`` goes to ``--errors`` (standard error by default).
+    """
+    import argparse
+    import io
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(
+        prog='ingreedypy',
+        description='Parse recipe ingredient lines into JSON lines.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='files to read; standard input if none or "-"')
+    parser.add_argument('-o', '--output', default='-', metavar='FILE',
+                        help='where to write results; standard output if "-"')
+    parser.add_argument('--errors', metavar='FILE',
+                        help='write failures here as JSON lines instead of '
+                             'to standard error')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='number of worker processes (default: none)')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='lines sent to a worker at a time')
+    parser.add_argument('--cache-size', type=int,
+                        help='memoize this many distinct lines')
+    parser.add_argument('--normalize', action='store_true',
+                        help='rewrite unusual spaces, dashes and full-width '
+                             'characters before parsing')
+    parser.add_argument('--locale', default='en',
+                        choices=sorted(['en'] + list(locales)),
+                        help='language of the units and number words')
+    args = parser.parse_args(argv)
+
+    def open_output(path, stream):
+        if path == '-':
+            return io.open(stream.fileno(), 'w', encoding='utf-8',
+                           buffering=1 << 16, closefd=False)
+        return io.open(path, 'w', encoding='utf-8', buffering=1 << 16)
+
+    def read_lines(paths):
+        # Undecodable bytes become U+FFFD rather than ending the stream.
+        for path in paths or ['-']:
+            if path == '-':
+                fh = io.open(sys.stdin.fileno(), encoding='utf-8',
+                             errors='replace', closefd=False)
+            else:
+                fh = io.open(path, encoding='utf-8', errors='replace')
+            with fh:
+                for line in fh:
+                    yield line
+
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    results = Ingreedy(
+        cache_size=args.cache_size, normalize=args.normalize,
+        locale=args.locale).parse_many(
+        read_lines(args.files), workers=args.workers,
+        chunk_size=args.chunk_size)
+    failures = 0
+    try:
+        with open_output(args.output, sys.stdout) as out, \
+                open_output(args.errors or '-', sys.stderr) as errors:
+            write = out.write
+            for result in results:
+                if isinstance(result, ParseFailure):
+                    failures += 1
+                    errors.write(encode(result._asdict()) + '\n')
+                    result = None
+                write(encode(result) + '\n')
+    except BrokenPipeError:
+        # The reader stopped early, as "| head" does. Point the standard
+        # streams at /dev/null so nothing more is flushed into the pipe.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        for stream in (sys.stdout, sys.stderr):
+            os.dup2(devnull, stream.fileno())
+        os.close(devnull)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,9 +1,25 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import asyncio
+import copy
+import functools
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from parsimonious.exceptions import ParseError, VisitationError
+from parsimonious.grammar import Grammar
 import pytest
 
-from ingreedypy import Ingreedy
+import ingreedypy
+from ingreedypy import (
+    DedupStats, Ingreedy, ParseBudgetExceeded, ParseFailure, ParseProfile,
+    ParseResult, ParseSession, Quantity)
 
 test_cases = {
     '1.0 cup flour': {
@@ -514,6 +530,46 @@ test_cases = {
         }],
         'ingredient': 'can crushed tomatoes',
     },
+    'an egg': {
+        'quantity': [{
+            'amount': 1,
+            'unit': None,
+            'unit_type': None,
+        }],
+        'ingredient': 'egg',
+    },
+    'eighteen eggs': {
+        'quantity': [{
+            'amount': 18,
+            'unit': None,
+            'unit_type': None,
+        }],
+        'ingredient': 'eggs',
+    },
+    'twenty-five grams sugar': {
+        'quantity': [{
+            'amount': 25,
+            'unit': 'gram',
+            'unit_type': 'metric',
+        }],
+        'ingredient': 'sugar',
+    },
+    'two hundred and fifty ml milk': {
+        'quantity': [{
+            'amount': 250,
+            'unit': 'milliliter',
+            'unit_type': 'metric',
+        }],
+        'ingredient': 'milk',
+    },
+    'a dozen eggs': {
+        'quantity': [{
+            'amount': 12,
+            'unit': None,
+            'unit_type': None,
+        }],
+        'ingredient': 'eggs',
+    },
     '1kg / 2lb 4oz potatoes': {
         'quantity': [{
             'amount': 1,
@@ -1030,14 +1086,22 @@ test_cases = {
         }],
         'ingredient': '1%-fat milk',
     },
-    # '2 PL cukr': {
-    #     'quantity': [{
-    #         'amount': 2,
-    #         'unit': 'PL',
-    #         'unit_type': 'abbreviated',
-    #     }],
-    #     'ingredient': 'cukr',
-    # },
+    '2 fl. oz. milk': {
+        'quantity': [{
+            'amount': 2,
+            'unit': 'fluid_ounce',
+            'unit_type': 'english',
+        }],
+        'ingredient': 'milk',
+    },
+    '2 touches (5 g) salt': {
+        'quantity': [{
+            'amount': 2,
+            'unit': 'touch',
+            'unit_type': 'imprecise',
+        }],
+        'ingredient': 'salt',
+    },
 }
 
 
@@ -1046,3 +1110,747 @@ def test_parser(description, expectation):
     result = Ingreedy().parse(description)
     for key in expectation:
         assert result[key] == expectation[key]
+
+
+def test_parse_many():
+    lines = list(test_cases) + ['1/0 cup flour', '2 cups\nflour']
+    results = list(Ingreedy().parse_many(line + '\n' for line in lines))
+    assert len(results) == len(lines)
+    for result, (description, expectation) in zip(results, test_cases.items()):
+        for key in expectation:
+            assert result[key] == expectation[key]
+
+    division, newline = results[-2:]
+    assert isinstance(division, ParseFailure)
+    assert division.index == len(lines) - 2
+    assert division.pos is None
+    assert isinstance(newline, ParseFailure)
+    assert newline.text == '2 cups\nflour'
+    assert newline.pos == 6
+
+
+def test_parse_many_workers():
+    lines = list(test_cases) * 3 + ['1/0 cup flour']
+    expected = list(Ingreedy().parse_many(lines))
+
+    ordered = list(Ingreedy().parse_many(lines, workers=2, chunk_size=7))
+    assert ordered == expected
+
+    unordered = Ingreedy().parse_many(
+        lines, workers=2, chunk_size=7, ordered=False)
+    assert sorted(unordered, key=lambda item: item[0]) == list(
+        enumerate(expected))
+
+
+def test_cache():
+    parser = Ingreedy(cache_size=2)
+    first = parser.parse('1 cup flour')
+    first['quantity'][0]['amount'] = 99
+    first['quantity'].append({})
+    assert parser.parse('1 cup flour') == test_cases['1.0 cup flour']
+    parser.parse('2 eggs')
+    parser.parse('3 eggs')
+    assert parser.cache_info() == (1, 3, 1, 2, 2)
+    parser.parse('1 cup flour')
+    assert parser.cache_info().misses == 4
+
+    parser.cache_clear()
+    assert parser.cache_info() == (0, 0, 0, 2, 0)
+    assert Ingreedy().cache_info() == (0, 0, 0, None, 0)
+
+
+fast_path_cases = list(test_cases) + [
+    '2 an egg', '2 a b', '2 touches salt', '2 fl oz milk', '2 fl,oz milk',
+    '2 tomatoes', '2 stick(s) butter', '2 cups  flour', '2 ten-eggs',
+    '2 tenders', '2 c.flour', '2 cups a', '1 0/0 cup flour', '2 cups\nflour',
+]
+
+
+@pytest.mark.parametrize('description', fast_path_cases)
+def test_fast_path(description):
+    fast = Ingreedy()
+    slow = Ingreedy(fast_path=False)
+    try:
+        expected = slow.parse(description)
+    except Exception as e:
+        with pytest.raises(type(e)):
+            fast.parse(description)
+        return
+    result = fast.parse(description)
+    assert result == expected
+    assert [type(q['amount']) for q in result['quantity']] == \
+        [type(q['amount']) for q in expected['quantity']]
+
+
+def test_fast_path_subclass():
+    class Upper(Ingreedy):
+        def visit_ingredient(self, node, visited_children):
+            return node.text.upper()
+
+    for options in [{}, {'fast_path': False}, {'direct': True}]:
+        assert Upper(**options).parse('2 cups flour')['ingredient'] == \
+            'FLOUR'
+        assert ParseSession(Upper(**options)).parse('2 cups flour') == \
+            Upper(**options).parse('2 cups flour')
+    assert Ingreedy().parse('2 cups flour')['ingredient'] == 'flour'
+
+
+def test_grammar_cache(tmp_path, monkeypatch):
+    lazy = Ingreedy.__dict__['grammar']
+    monkeypatch.setattr(ingreedypy, 'grammar_cache_dir', str(tmp_path))
+
+    def load():
+        return ingreedypy._LazyGrammar(
+            lazy.rules, **lazy.custom_rules).__get__(None, Ingreedy)
+
+    compiled = load()
+    cached, = tmp_path.iterdir()
+    loaded = load()
+    assert loaded is not compiled
+    assert Ingreedy().visit(loaded.parse('1 kg / 2 fl oz milk')) == \
+        Ingreedy().visit(compiled.parse('1 kg / 2 fl oz milk'))
+
+    cached.write_bytes(b'garbage')
+    assert load() is not None
+
+    # A cache written by other versions is not picked up.
+    monkeypatch.setattr(ingreedypy, '__version__', '0.0.0')
+    assert load() is not compiled
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # Custom rules that can't be pickled skip the cache.
+    def unpicklable(text, pos):
+        return pos
+
+    grammar = ingreedypy._LazyGrammar(
+        lazy.rules, **dict(lazy.custom_rules, letter=unpicklable)
+    ).__get__(None, Ingreedy)
+    assert grammar['letter'] is not None
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_grammar_cache_write_error(tmp_path, monkeypatch):
+    lazy = Ingreedy.__dict__['grammar']
+    monkeypatch.setattr(ingreedypy, 'grammar_cache_dir', str(tmp_path))
+
+    def dump(*args):
+        raise TypeError('cannot pickle')
+
+    monkeypatch.setattr('pickle.dump', dump)
+    grammar = ingreedypy._LazyGrammar(
+        lazy.rules, **lazy.custom_rules).__get__(None, Ingreedy)
+    assert grammar['unit'] is not None
+    assert list(tmp_path.iterdir()) == []
+
+
+def rule_per_unit_grammar(**extra_units):
+    # Ingreedy's grammar spelled out the way subclasses have long extended
+    # it: an ordered choice of literals per unit, grouped by unit system.
+    rules = [vars(Ingreedy)['grammar'].rules,
+             'unit = english_unit / metric_unit / imprecise_unit']
+    for system, units in sorted(ingreedypy.unit_aliases.items()):
+        units = dict(units, **extra_units.get(system, {}))
+        rules.append('%s_unit = %s' % (system, ' / '.join(units)))
+        for unit, aliases in units.items():
+            rules.append('%s = %s' % (unit, ' / '.join(
+                json.dumps(alias) for alias in aliases)))
+    rules.append('written_number = %s' % ' / '.join(
+        json.dumps(word) for word in sorted(
+            ingreedypy.number_value, key=len, reverse=True)))
+    return Grammar('\n'.join(rules))
+
+
+def test_subclass_grammar():
+    class Sprigs(Ingreedy):
+        grammar = rule_per_unit_grammar(
+            imprecise={'sprig': ['sprigs', 'sprig']})
+
+    lines = ['2 cups flour', '1 kg potatoes', '1 1/2 tsp salt',
+             '12 (6-ounce) chicken breasts', 'a pinch of salt', 'two eggs']
+    for options in [{}, {'fast_path': False}, {'direct': True}]:
+        parser = Sprigs(**options)
+        for line in lines:
+            assert parser.parse(line) == Ingreedy().parse(line)
+            assert ParseSession(parser).parse(line) == Ingreedy().parse(line)
+        assert parser.parse('3 sprigs thyme') == {
+            'quantity': [{'unit': 'sprig', 'unit_type': 'imprecise',
+                          'amount': 3}],
+            'ingredient': 'thyme'}
+        assert list(parser.parse_many(lines)) == \
+            list(Ingreedy().parse_many(lines))
+
+
+@pytest.mark.parametrize('description', fast_path_cases[:-2])
+def test_compact(description):
+    for fast_path in (True, False):
+        result = Ingreedy(compact=True, fast_path=fast_path).parse(description)
+        assert isinstance(result, ParseResult)
+        assert all(isinstance(q, Quantity) for q in result.quantity)
+        assert result.to_dict() == Ingreedy().parse(description)
+
+
+def test_compact_cache():
+    parser = Ingreedy(compact=True, cache_size=10)
+    assert parser.parse('2 cups flour') is parser.parse('2 cups flour')
+
+
+def test_main(tmp_path):
+    source = tmp_path / 'lines.txt'
+    source.write_text('2 cups flour\n1/0 cup flour\n½ tsp salt\n',
+                      encoding='utf-8')
+    output = tmp_path / 'out.jsonl'
+    errors = tmp_path / 'errors.jsonl'
+    status = ingreedypy.main([str(source), '-o', str(output),
+                              '--errors', str(errors)])
+    assert status == 1
+
+    results = [json.loads(line) for line in
+               output.read_text(encoding='utf-8').splitlines()]
+    assert results == [
+        Ingreedy().parse('2 cups flour'), None, Ingreedy().parse('½ tsp salt')]
+    failure, = errors.read_text(encoding='utf-8').splitlines()
+    assert json.loads(failure) == {
+        'index': 1, 'text': '1/0 cup flour', 'pos': None,
+        'error': 'ZeroDivisionError: float division by zero'}
+
+
+def test_main_invalid_utf8(tmp_path):
+    source = tmp_path / 'lines.txt'
+    source.write_bytes(b'1 cup fl\xffour\n\xfe\n2 cups sugar\n')
+    output = tmp_path / 'out.jsonl'
+    assert ingreedypy.main([str(source), '-o', str(output)]) == 0
+    results = [json.loads(line) for line in
+               output.read_text(encoding='utf-8').splitlines()]
+    assert len(results) == 3
+    assert results[0]['ingredient'] == 'fl�our'
+    assert results[2] == Ingreedy().parse('2 cups sugar')
+
+
+def test_main_broken_pipe(tmp_path):
+    source = tmp_path / 'lines.txt'
+    source.write_text('2 cups flour\n' * 100000, encoding='utf-8')
+    process = subprocess.Popen(
+        [sys.executable, ingreedypy.__file__, str(source)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert json.loads(process.stdout.readline()) == \
+        Ingreedy().parse('2 cups flour')
+    process.stdout.close()
+    assert process.stderr.read() == b''
+    assert process.wait() == 0
+
+
+def test_profile():
+    profile = ParseProfile()
+    parser = Ingreedy(profile=profile)
+    for description, expectation in test_cases.items():
+        result = parser.parse(description)
+        for key in expectation:
+            assert result[key] == expectation[key]
+
+    fast_path = profile.rules['<fast path>']
+    assert fast_path[0] == len(test_cases)
+    parsed = fast_path[2]
+    assert profile.rules['ingredient_addition'][1:] == [parsed, 0]
+    assert profile.visits['visit_ingredient_addition'][0] == parsed
+    assert 'ingredient_addition' in profile.report(top=100)
+
+    profile.clear()
+    assert profile.rules == profile.visits == {}
+    parser.parse('2 (five ounce) cans tuna')
+    assert profile.rules['ingredient_addition'][0] == 1
+    assert profile.visits['visit_ingredient_addition'][0] == 1
+
+
+@pytest.mark.parametrize('description',
+                         list(test_cases) + fast_path_cases[-2:])
+def test_direct(description):
+    direct = Ingreedy(fast_path=False, direct=True)
+    tree = Ingreedy(fast_path=False)
+    try:
+        expected = tree.parse(description)
+    except Exception as e:
+        with pytest.raises(type(e)):
+            direct.parse(description)
+        return
+    assert repr(direct.parse(description)) == repr(expected)
+
+
+def test_direct_profile():
+    profile = ParseProfile()
+    Ingreedy(fast_path=False, direct=True, profile=profile).parse(
+        '2 (five ounce) cans tuna')
+    assert profile.rules['ingredient_addition'][1:] == [1, 0]
+    assert profile.visits['visit_multipart_quantity'][0] == 1
+
+
+@pytest.mark.parametrize('executor', [
+    None, ThreadPoolExecutor, ProcessPoolExecutor])
+def test_parse_async(executor, monkeypatch):
+    parser = Ingreedy()
+    calls = []
+    parse_text = ingreedypy._parse_text
+
+    def counted(*args):
+        calls.append(args)
+        return parse_text(*args)
+
+    if executor is not ProcessPoolExecutor:  # which can't pickle counted
+        monkeypatch.setattr(ingreedypy, '_parse_text', counted)
+
+    async def run(pool):
+        result = await parser.parse_async('2 cups flour', pool)
+        with pytest.raises(VisitationError) as error:
+            await parser.parse_async('1/0 cup flour', pool)
+        assert error.value.original_class is ZeroDivisionError
+        with pytest.raises(ParseError) as error:
+            await parser.parse_async('2 cups\nflour', pool)
+        assert error.value.pos == 6
+        return result
+
+    if executor is None:
+        result = asyncio.run(run(None))
+    else:
+        with executor(1) as pool:
+            result = asyncio.run(run(pool))
+    assert result == parser.parse('2 cups flour')
+    if executor is not ProcessPoolExecutor:
+        assert len(calls) == 3  # each line is parsed once
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_parse_many_async(processes):
+    lines = list(test_cases) * 3 + ['1/0 cup flour']
+    expected = list(Ingreedy().parse_many(lines))
+
+    async def aiter_lines():
+        for line in lines:
+            yield line
+
+    async def run(executor):
+        return [result async for result in Ingreedy().parse_many_async(
+            aiter_lines(), executor=executor, chunk_size=7, max_in_flight=2)]
+
+    if processes:
+        with ProcessPoolExecutor(2) as executor:
+            assert asyncio.run(run(executor)) == expected
+    else:
+        assert asyncio.run(run(None)) == expected
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_parse_file(tmp_path, workers):
+    lines = list(test_cases) * 3 + ['1/0 cup flour', '½ cup crème fraîche']
+    path = tmp_path / 'lines.txt'
+    path.write_bytes('\r\n'.join(lines).encode('utf-8'))
+    expected = list(Ingreedy().parse_many(lines))
+
+    results = list(Ingreedy().parse_file(
+        str(path), workers=workers, chunk_bytes=100))
+    assert results == expected
+    assert results[-2].index == len(lines) - 2
+
+    empty = tmp_path / 'empty.txt'
+    empty.write_bytes(b'')
+    assert list(Ingreedy().parse_file(str(empty), workers=workers)) == []
+
+
+@pytest.mark.parametrize('max_distinct', [100000, 5])
+def test_parse_unique(tmp_path, max_distinct):
+    lines = (list(test_cases)[:20] + ['1/0 cup flour\n']) * 4
+    expected = list(Ingreedy().parse_many(lines))
+
+    stats = DedupStats()
+    results = list(Ingreedy().parse_unique(
+        lines, stats=stats, max_distinct=max_distinct, tmp_dir=str(tmp_path)))
+    assert results == expected
+    assert (stats.lines, stats.distinct, stats.ratio) == (84, 21, 4.0)
+    assert bool(stats.spilled) == (max_distinct == 5)
+
+    results[0]['quantity'].append('mutated')
+    assert results[21] == expected[21]
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                    reason='counts open files in /proc')
+def test_parse_unique_open_files(tmp_path):
+    lines = ['%d g flour' % n for n in range(3000)]
+    before = len(os.listdir('/proc/self/fd'))
+    most = 0
+    for index, result in enumerate(Ingreedy().parse_unique(
+            lines, max_distinct=5, tmp_dir=str(tmp_path))):
+        assert result['quantity'][0]['amount'] == index
+        most = max(most, len(os.listdir('/proc/self/fd')) - before)
+    assert most < 100  # not one file for each of the 600 runs
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'fast_path': False}, {'fast_path': False, 'direct': True}])
+def test_fields(options):
+    full = Ingreedy(**options)
+    quantity = Ingreedy(fields=['quantity'], **options)
+    ingredient = Ingreedy(fields=['ingredient'], **options)
+    for description in test_cases:
+        expected = full.parse(description)
+        assert quantity.parse(description) == {
+            'quantity': expected['quantity'], 'ingredient': None}
+        assert ingredient.parse(description) == {
+            'quantity': None, 'ingredient': expected['ingredient']}
+
+    assert quantity.parse('2 cups\nflour')['quantity'][0]['amount'] == 2
+    compact = Ingreedy(fields=['ingredient'], compact=True, **options)
+    assert compact.parse('2 cups flour').to_dict() == {
+        'quantity': None, 'ingredient': 'flour'}
+    with pytest.raises(ValueError):
+        Ingreedy(fields=['unit'])
+
+
+def test_convert_quantities():
+    numpy = pytest.importorskip('numpy')
+    units = [unit for system in ingreedypy.unit_aliases.values()
+             for unit in system]
+    assert sorted(units) == list(ingreedypy.unit_names)
+    assert set(ingreedypy.unit_factors) == \
+        set(units) - set(ingreedypy.unit_aliases['imprecise'])
+
+    converted = ingreedypy.convert_quantities(
+        [2, 1, 3, 1, 500, 1], ['cup', 'pound', 'pinch', None, 'gram', 'joule'])
+    numpy.testing.assert_allclose(
+        converted.amount[[0, 1, 4]], [473.176473, 453.59237, 500])
+    assert numpy.isnan(converted.amount[[2, 3]]).all()
+    assert converted.amount[5] == pytest.approx(1 / 4184.0)
+    assert [ingreedypy.unit_names[code] if code >= 0 else None
+            for code in converted.unit] == [
+        'milliliter', 'gram', None, None, 'gram', 'calorie']
+    assert converted.imprecise.tolist() == [
+        False, False, True, False, False, False]
+
+    codes = numpy.array([ingreedypy.unit_names.index('tablespoon'), -1])
+    to_cups = ingreedypy.convert_quantities([16, 1], codes, to='cup')
+    assert to_cups.amount[0] == pytest.approx(1)
+    assert ingreedypy.convert_quantities(
+        [1], ['pound'], to='cup').unit.tolist() == [-1]
+    for codes in ([-2, 999], numpy.array([255, 200], dtype=numpy.uint8)):
+        unknown = ingreedypy.convert_quantities([1, 1], codes)
+        assert numpy.isnan(unknown.amount).all()
+        assert unknown.unit.tolist() == [-1, -1]
+        assert not unknown.imprecise.any()
+    with pytest.raises(ValueError):
+        ingreedypy.convert_quantities([1], ['cup'], to='furlong')
+
+
+def test_parse_columns():
+    lines = list(test_cases) + ['1/0 cup flour']
+    expected = list(Ingreedy().parse_many(lines))
+    columns = Ingreedy().parse_columns(lines)
+    assert len(columns) == len(lines)
+    assert [failure.index for failure in columns.failures] == [len(lines) - 1]
+
+    offsets = columns.quantity_offsets
+    for index, result in enumerate(expected[:-1]):
+        rows = range(offsets[index], offsets[index + 1])
+        assert [(ingreedypy.unit_names[columns.unit[row]]
+                 if columns.unit[row] >= 0 else None,
+                 ingreedypy.unit_types[columns.unit_type[row]]
+                 if columns.unit_type[row] >= 0 else None,
+                 columns.amount[row]) for row in rows] == [
+            (q['unit'], q['unit_type'], q['amount'])
+            for q in result['quantity']]
+        start, end = columns.ingredient_offsets[index:index + 2]
+        ingredient = columns.ingredient_data[start:end].decode('utf-8')
+        assert (ingredient if columns.ingredient_valid[index] else None) == \
+            result['ingredient']
+    assert not columns.valid[-1]
+
+    ingredients = Ingreedy(fields=['ingredient'], max_length=20)
+    ingredients = ingredients.parse_columns(['2 cups', '2 cups flour' * 2])
+    assert list(ingredients.valid) == [1, 0]
+    assert list(ingredients.ingredient_valid) == [0, 0]
+    assert [failure.index for failure in ingredients.failures] == [1]
+
+    pytest.importorskip('numpy')
+    assert columns.to_numpy()['amount'].tolist() == list(columns.amount)
+    pytest.importorskip('pyarrow')
+    rows = columns.to_arrow().to_pylist()
+    assert rows[:-1] == expected[:-1]
+    assert rows[-1] == {'quantity': None, 'ingredient': None}
+
+
+def test_session():
+    def outcome(parse, text):
+        try:
+            return repr(parse(text))
+        except Exception as e:
+            return type(e)
+
+    full = Ingreedy(fast_path=False)
+    for index, line in enumerate(test_cases):
+        session = ParseSession(Ingreedy(fast_path=False))
+        edits = [line[:end] for end in range(len(line) + 1)]
+        edits += [line[:index % len(line)] + '2 ' + line[index % len(line):],
+                  line[1:], line + '\n', line]
+        for text in edits:
+            assert outcome(session.parse, text) == outcome(full.parse, text)
+
+    session = ParseSession(Ingreedy(fast_path=False))
+    session.parse('2 cups flour')['quantity'].append('mutated')
+    assert session.parse('2 cups flour') == full.parse('2 cups flour')
+
+
+@pytest.mark.parametrize('options', [
+    {'memo_rules': ingreedypy.selective_memo_rules},
+    {'memo_rules': []},
+    {'memo_limit': 10},
+    {'memo_rules': ingreedypy.selective_memo_rules, 'direct': True},
+    {'memo_limit': 10, 'direct': True},
+    {'memo_limit': 10, 'profile': ParseProfile()}])
+def test_memo_policy(options):
+    full = Ingreedy(fast_path=False)
+    bounded = Ingreedy(fast_path=False, **options)
+    for description in test_cases:
+        assert repr(bounded.parse(description)) == \
+            repr(full.parse(description))
+
+    cache = bounded._new_cache()
+    bounded._match('2 (five ounce) cans tuna', cache)
+    entries = sum(len(memo) for memo in cache.values())
+    if 'memo_limit' in options:
+        assert entries == 10
+    if options.get('memo_rules') == []:
+        assert entries == 0
+
+
+adversarial_lines = ['1 ' * 20000, '1,' * 20000, '1-' * 20000,
+                     '2 (' * 10000 + 'x']
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'direct': True},
+    {'direct': True, 'memo_rules': ingreedypy.selective_memo_rules},
+    {'direct': True, 'memo_rules': []},
+    {'direct': True, 'memo_rules': ['catch_all']},
+    {'profile': ParseProfile()}])
+@pytest.mark.parametrize('budget', [{'timeout': 0.05}, {'max_steps': 20000}])
+def test_parse_budget(options, budget):
+    parser = Ingreedy(fast_path=False, **dict(options, **budget))
+    session = ParseSession(parser)
+    for description in test_cases:
+        assert parser.parse(description) == Ingreedy().parse(description)
+        assert session.parse(description) == Ingreedy().parse(description)
+
+    for parse in [parser.parse, session.parse]:
+        for line in adversarial_lines:
+            start = time.perf_counter()
+            try:
+                parse(line)
+            except ParseBudgetExceeded as e:
+                assert e.limit in budget
+            assert time.perf_counter() - start < 1
+    with pytest.raises(ParseBudgetExceeded):
+        ParseSession(parser).parse(adversarial_lines[1])
+
+    if options.get('memo_rules') == []:
+        # Nothing is memoized, so every step is counted outside the memo.
+        with pytest.raises(ParseBudgetExceeded):
+            parser.parse('1 ' * 3000)
+
+    failures = list(parser.parse_many(adversarial_lines[:1]))
+    assert failures[0].pos is None
+    assert 'ran over' in failures[0].error
+
+
+def test_max_length():
+    parser = Ingreedy(max_length=100)
+    assert parser.parse('2 cups flour')['ingredient'] == 'flour'
+    with pytest.raises(ParseBudgetExceeded) as info:
+        parser.parse('2 cups flour' * 10)
+    assert info.value.limit == 'max_length'
+    with pytest.raises(ParseBudgetExceeded):
+        ParseSession(parser).parse('2 cups flour' * 10)
+    assert isinstance(
+        list(parser.parse_many(['2 cups flour' * 10], workers=2))[0],
+        ParseFailure)
+
+
+typographic_cases = [
+    ('2\u00a0cups flour', '2 cups flour'),
+    ('\uff12 cups flour', '2 cups flour'),
+    ('2\u20133 tbsp oil', '2-3 tbsp oil'),
+    ('1\u20442 cup sugar', '1/2 cup sugar'),
+    ('\ufeff4 eggs', '4 eggs'),
+    ('\uff11\uff10\uff10 g \ufb02our', '100 g flour'),
+    ('1\u00bd cups flour', '1\u00bd cups flour'),
+]
+
+
+@pytest.mark.parametrize('options', [{}, {'fast_path': False, 'direct': True}])
+@pytest.mark.parametrize('typographic,ascii', typographic_cases)
+def test_normalize(typographic, ascii, options):
+    assert ingreedypy.normalize(typographic) == ascii
+    expected = Ingreedy().parse(ascii)
+    parser = Ingreedy(normalize=True, **options)
+    assert parser.parse(typographic) == expected
+    assert ParseSession(parser).parse(typographic) == expected
+
+    offsets = ingreedypy.normalized_offsets(typographic)
+    assert len(offsets) == len(ascii) + 1
+    assert offsets[-1] == len(typographic)
+
+
+def test_normalize_error():
+    line = '\ufeff2\u00a0cups\nflour'
+    with pytest.raises(ParseError) as info:
+        Ingreedy(normalize=True).parse(line)
+    assert info.value.text == line
+    assert info.value.pos == 7
+    assert ingreedypy.normalize('2 cm\u00b2 pieces') == '2 cm\u00b2 pieces'
+
+
+locale_cases = {
+    'cs': {
+        '2 PL cukr': {
+            'quantity': [{
+                'amount': 2,
+                'unit': 'tablespoon',
+                'unit_type': 'english',
+            }],
+            'ingredient': 'cukr',
+        },
+        'dvě lžičky soli': {
+            'quantity': [{
+                'amount': 2,
+                'unit': 'teaspoon',
+                'unit_type': 'english',
+            }],
+            'ingredient': 'soli',
+        },
+        'dvacet pět g másla': {
+            'quantity': [{
+                'amount': 25,
+                'unit': 'gram',
+                'unit_type': 'metric',
+            }],
+            'ingredient': 'másla',
+        },
+        'špetka soli': {
+            'quantity': [{
+                'amount': 1,
+                'unit': 'pinch',
+                'unit_type': 'imprecise',
+            }],
+            'ingredient': 'soli',
+        },
+    },
+}
+
+
+@pytest.mark.parametrize('options', [{}, {'fast_path': False, 'direct': True}])
+@pytest.mark.parametrize('locale,description,expectation', [
+    (locale, description, expectation)
+    for locale, cases in locale_cases.items()
+    for description, expectation in cases.items()])
+def test_locale(locale, description, expectation, options):
+    assert Ingreedy(locale=locale, **options).parse(description) == \
+        expectation
+    assert Ingreedy(**options).parse(description, locale=locale) == \
+        expectation
+    assert Ingreedy().parse(description) != expectation
+    with pytest.raises(ValueError):
+        Ingreedy(locale=locale.upper())
+
+
+@pytest.fixture
+def unit_registry(monkeypatch):
+    # register_unit() changes module-wide state; restore it afterwards.
+    for name in ['unit_aliases', 'locales', 'unit_names', 'unit_types']:
+        monkeypatch.setattr(ingreedypy, name,
+                            copy.deepcopy(getattr(ingreedypy, name)))
+    monkeypatch.setattr(ingreedypy, '_locale_grammars', {})
+    monkeypatch.setattr(ingreedypy, '_registered_units', [])
+    lazy = vars(Ingreedy)['grammar']
+    for grammar in [lazy.custom_rules, Ingreedy.grammar]:
+        for rule in ['unit', 'imprecise_unit']:
+            expression = grammar[rule]
+            monkeypatch.setattr(expression, 'trie',
+                                copy.deepcopy(expression.trie))
+            monkeypatch.setattr(expression, 'identity_tuple',
+                                expression.identity_tuple)
+
+
+def test_register_unit(unit_registry):
+    parsers = [Ingreedy(cache_size=10), Ingreedy(fast_path=False),
+               Ingreedy(fast_path=False, direct=True),
+               ParseSession(Ingreedy(fast_path=False))]
+    for parser in parsers:
+        assert parser.parse('2 sprigs thyme')['ingredient'] == 'sprigs thyme'
+    codes = ingreedypy.unit_names
+
+    ingreedypy.register_unit('sprig', 'imprecise', ['sprigs', 'sprig'])
+    ingreedypy.register_unit('bunch', 'bunches', ['bunches', 'bunch'])
+    for parser in parsers:
+        assert parser.parse('2 sprigs thyme') == {
+            'quantity': [{'unit': 'sprig', 'unit_type': 'imprecise',
+                          'amount': 2}],
+            'ingredient': 'thyme'}
+        assert parser.parse('1 bunch parsley')['quantity'] == [
+            {'unit': 'bunch', 'unit_type': 'bunches', 'amount': 1}]
+    assert ingreedypy.unit_names == codes + ('sprig', 'bunch')
+    assert ingreedypy.unit_types[-1] == 'bunches'
+
+    ingreedypy.register_unit('teaspoon', 'english', ['kávové lžičky'],
+                             locale='cs')
+    assert Ingreedy(locale='cs').parse('2 kávové lžičky soli')[
+        'quantity'][0]['unit'] == 'teaspoon'
+    with pytest.raises(ValueError):
+        ingreedypy.register_unit('sprig', 'imprecise', [''])
+
+
+def test_register_unit_spawned_workers(unit_registry, monkeypatch):
+    ingreedypy.register_unit('sprig', 'imprecise', ['sprigs', 'sprig'])
+    ingreedypy.register_unit('bunch', 'bunches', ['bunches', 'bunch'])
+    lines = ['2 sprigs thyme', '1 bunch parsley', '2 cups flour']
+    expected = list(Ingreedy().parse_many(lines))
+    assert expected[1]['quantity'][0]['unit'] == 'bunch'
+
+    # Spawned workers start from a fresh import of the module.
+    spawn = multiprocessing.get_context('spawn')
+    monkeypatch.setattr('concurrent.futures.ProcessPoolExecutor',
+                        functools.partial(ProcessPoolExecutor,
+                                          mp_context=spawn))
+    assert list(Ingreedy().parse_many(lines, workers=1)) == expected
+
+    async def run(pool):
+        parser = Ingreedy()
+        results = [await parser.parse_async(line, pool) for line in lines]
+        async for result in parser.parse_many_async(lines, pool):
+            results.append(result)
+        return results
+
+    with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+        assert asyncio.run(run(pool)) == expected * 2
+
+
+@pytest.mark.parametrize('options', [
+    {'cache_size': 8},
+    {'fast_path': False, 'direct': True},
+    {'fast_path': False, 'memo_limit': 100}])
+def test_shared_between_threads(options):
+    lines = list(test_cases) * 5 + ['1/0 cup flour']
+    expected = list(Ingreedy().parse_many(lines))
+    parser = Ingreedy(**options)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            assert list(pool.map(parser._parse_chunk, [
+                (index, [line]) for index, line in enumerate(lines)])) == [
+                (index, [result]) for index, result in enumerate(expected)]
+    finally:
+        sys.setswitchinterval(interval)
+    if 'cache_size' in options:
+        info = parser.cache_info()
+        assert info.hits + info.misses == len(lines)
+
+    assert list(parser.parse_many(
+        lines, workers=4, chunk_size=7, threads=True)) == expected
@@ -1,13 +1,18 @@
+import re
+
 from setuptools import setup
 
 with open('README.md', 'r') as fh:
     long_description = fh.read()
 
+with open('ingreedypy.py', 'r') as fh:
+    version = re.search(r"^__version__ = '([^']+)'", fh.read(), re.M).group(1)
+
 
 setup(
     name='ingreedypy',
     py_modules=['ingreedypy'],
-    version='1.3.8',
+    version=version,
     description='ingreedy-py parses recipe ingredient lines into a object',
     long_description=long_description,
     long_description_content_type='text/markdown',
@@ -15,10 +20,19 @@ setup(
     author_email='scttcper@gmail.com',
     url='https://github.com/openculinary/ingreedy-py',
     keywords=['ingreedy', 'ingreedypy', 'recipe', 'parser'],
+    python_requires='>=3.7',
     install_requires=[
-        'parsimonious'
+        'parsimonious>=0.10'
     ],
+    entry_points={
+        'console_scripts': [
+            'ingreedypy=ingreedypy:main',
+        ],
+    },
     extras_require={
+        'numpy': [
+            'numpy',
+        ],
         'tests': [
             'pytest',
             'pytest-cov',